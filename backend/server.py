@@ -1,16 +1,324 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime, timedelta
+from collections import Counter, OrderedDict
 import httpx
+import abc
+import asyncio
+import base64
+import bisect
+import concurrent.futures
+import contextlib
+import difflib
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import re
+import threading
 import uuid
+import time
+import zlib
+import logging
 import os
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib encoder is used without it
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional; responses fall back to gzip without it
+    brotli = None
+
 load_dotenv()
 
+logger = logging.getLogger("contextos")
+
+# Metrics
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            label_text = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-1]}")
+        return lines
+
+class LabeledCounter:
+    """Thread-safe Prometheus counter keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: int = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for labels, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{{{format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+def format_labels(names: tuple, values: tuple) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+http_request_duration = Histogram(
+    "contextos_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status")
+)
+mongo_command_duration = Histogram(
+    "contextos_mongo_command_duration_seconds",
+    "MongoDB command latency by collection and command",
+    ("collection", "command")
+)
+mongo_command_failures = LabeledCounter(
+    "contextos_mongo_command_failures_total",
+    "MongoDB commands that returned an error",
+    ("collection", "command")
+)
+mongo_slow_commands = LabeledCounter(
+    "contextos_mongo_slow_commands_total",
+    f"MongoDB commands slower than MONGO_SLOW_QUERY_MS ({MONGO_SLOW_QUERY_MS:g} ms)",
+    ("collection", "command")
+)
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request latency, including streamed bodies"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_holder = {"status": 500}
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI records the matched route in the scope; label by its template, not the raw path
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(
+                (scope["method"], route_label, f"{status_holder['status'] // 100}xx"),
+                time.perf_counter() - started
+            )
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding the Mongo metrics and the slow-query log.
+
+    Called from Motor's worker threads, hence the lock around in-flight commands.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else "-"
+        with self._lock:
+            self._in_flight[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            labels = self._in_flight.pop((event.connection_id, event.request_id), None)
+        if labels is None:
+            return
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_duration.observe(labels, seconds)
+        if failed:
+            mongo_command_failures.inc(labels)
+        if seconds * 1000 >= MONGO_SLOW_QUERY_MS:
+            mongo_slow_commands.inc(labels)
+            logger.warning("Slow MongoDB %s on %s took %.1f ms", labels[1], labels[0], seconds * 1000)
+
+# Compression
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+compression_input_bytes = LabeledCounter(
+    "contextos_compression_input_bytes_total",
+    "Response bytes before compression",
+    ("encoding",)
+)
+compression_output_bytes = LabeledCounter(
+    "contextos_compression_output_bytes_total",
+    "Response bytes after compression",
+    ("encoding",)
+)
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content coding the client accepts"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if token.strip():
+            weights[token.strip().lower()] = weight
+    
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def make_compressor(encoding: str) -> tuple:
+    """Return (compress, flush, finish) callables for a streaming compressor"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli compression for JSON and NDJSON responses.
+
+    Whole bodies under ``COMPRESSION_MIN_SIZE`` are sent as-is. Streamed bodies
+    are compressed chunk by chunk and flushed after each one, so NDJSON readers
+    still receive lines as they are produced.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        state = {"start": None, "passthrough": False, "compressor": None}
+        
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            
+            if state["start"] is not None:
+                start, state["start"] = state["start"], None
+                headers = MutableHeaders(raw=list(start["headers"]))
+                compressible = (
+                    start["status"] not in (204, 304)
+                    and "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_CONTENT_TYPES)
+                )
+                if not compressible or (not more_body and len(body) < COMPRESSION_MIN_SIZE):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                
+                state["compressor"] = make_compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    compress, _, finish = state["compressor"]
+                    compressed = compress(body) + finish()
+                    headers["Content-Length"] = str(len(compressed))
+                    compression_input_bytes.inc((encoding,), len(body))
+                    compression_output_bytes.inc((encoding,), len(compressed))
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start, "headers": headers.raw})
+            
+            compress, flush, finish = state["compressor"]
+            chunk = compress(body) + (flush() if more_body else finish())
+            compression_input_bytes.inc((encoding,), len(body))
+            compression_output_bytes.inc((encoding,), len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        
+        await self.app(scope, receive, send_compressed)
+
 app = FastAPI(title="ContextOS API", version="1.0.0")
 
 # CORS Configuration
@@ -20,11 +328,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag", "X-Next-Cursor", "Server-Timing", "Retry-After",
+        "X-Missing-Variables", "X-Unused-Variables"
+    ],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # MongoDB connection
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/contextos")
-client = AsyncIOMotorClient(MONGO_URL)
+# Pool sizes are per worker process: total connections = workers x MONGO_MAX_POOL_SIZE
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    event_listeners=[MongoCommandMetrics()]
+)
 db = client.contextos
 
 # Collections
@@ -32,6 +354,12 @@ users_collection = db.users
 prompts_collection = db.prompts
 categories_collection = db.categories
 sessions_collection = db.sessions
+prompt_versions_collection = db.prompt_versions
+prompt_tombstones_collection = db.prompt_tombstones
+sync_counters_collection = db.sync_counters
+prompt_stats_collection = db.prompt_stats
+jobs_collection = db.jobs
+job_results_collection = db.job_results
 
 # Pydantic Models
 class User(BaseModel):
@@ -56,22 +384,104 @@ class Prompt(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class PromptListItem(BaseModel):
+    """Prompt as returned by list endpoints; fields outside a ``fields`` projection are omitted"""
+    id: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    category: Optional[str] = None
+    variables: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+def check_category(value: Optional[str]) -> Optional[str]:
+    """Validate a category id against the in-memory catalog"""
+    if value is not None and not category_catalog.is_known(value):
+        raise ValueError(f"Unknown category: {value}")
+    return value
+
+PROMPT_MAX_CONTENT_CHARS = int(os.getenv("PROMPT_MAX_CONTENT_CHARS", str(5_000_000)))
+
 class PromptCreate(BaseModel):
     title: str
-    content: str
+    content: str = Field(max_length=PROMPT_MAX_CONTENT_CHARS)
     category: str
 
+    _check_category = field_validator("category")(check_category)
+
 class PromptUpdate(BaseModel):
     title: Optional[str] = None
-    content: Optional[str] = None
+    content: Optional[str] = Field(None, max_length=PROMPT_MAX_CONTENT_CHARS)
     category: Optional[str] = None
 
+    _check_category = field_validator("category")(check_category)
+
+class PromptVersionSummary(BaseModel):
+    version: int
+    title: str
+    category: str
+    created_at: datetime
+
+class PromptVersion(PromptVersionSummary):
+    prompt_id: str
+    content: str
+    variables: List[str] = []
+
+class BatchGenerateRequest(BaseModel):
+    prompt_id: Optional[str] = None
+    prompt_ids: List[str] = []
+    variable_sets: List[Dict[str, str]]
+    strict: bool = False
+
+class JobSubmit(BaseModel):
+    type: Literal["generate_batch", "reindex_search", "recompute_variables"]
+    params: Dict[str, Any] = {}
+
+class JobStatus(BaseModel):
+    id: str
+    type: str
+    status: str
+    progress: Dict[str, int] = {}
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class Category(BaseModel):
     id: str
     name: str
     description: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Serialization
+# "fast" writes projected Mongo documents straight to JSON bytes; "validated"
+# returns them through the response_model as before. Overridable per request.
+SERIALIZATION_MODE = os.getenv("SERIALIZATION_MODE", "fast")
+
+def json_default(value: Any) -> Any:
+    """json.dumps fallback for the non-JSON types stored in Mongo documents"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_json(payload: Any) -> bytes:
+    """Serialize to compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=json_default, separators=(",", ":")).encode()
+
+def use_fast_serializer(serializer: Optional[str]) -> bool:
+    return (serializer or SERIALIZATION_MODE) == "fast"
+
+def raw_json_response(payload: Any, response: Optional[Response] = None) -> Response:
+    """JSON response that skips response_model validation, keeping headers set on ``response``"""
+    raw = Response(content=dumps_json(payload), media_type="application/json")
+    if response is not None:
+        raw.headers.update(response.headers)
+    return raw
+
 # Categories
 DEFAULT_CATEGORIES = [
     {"id": "content-creation", "name": "Content Creation", "description": "Social media, copywriting"},
@@ -79,80 +489,1463 @@ DEFAULT_CATEGORIES = [
     {"id": "business", "name": "Business", "description": "Emails, proposals, analysis"},
     {"id": "general", "name": "General", "description": "Catch-all for misc prompts"}
 ]
+CATEGORY_CATALOG_REFRESH_SECONDS = float(os.getenv("CATEGORY_CATALOG_REFRESH_SECONDS", "60"))
+
+class CategoryCatalog:
+    """Process-wide, read-only snapshot of the categories collection.
+
+    The snapshot is serialized once; requests are answered from the cached
+    bytes. Every ``refresh_seconds`` a background task re-reads the collection
+    and replaces the snapshot if its content version changed, so prompt
+    validation picks up new categories without anyone listing them first.
+    """
+
+    def __init__(self, categories: List[dict], refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.checked_at = float("-inf")
+        self.version = None
+        self._install(categories)
+
+    def is_known(self, category_id: str) -> bool:
+        return category_id in self.ids
+
+    async def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.refresh_seconds:
+            return
+        # Stamp before awaiting so concurrent requests don't all reload
+        self.checked_at = now
+        documents = await categories_collection.find({}, {"_id": 0}).to_list(None)
+        if documents and self._version_of(documents) != self.version:
+            self._install(documents)
+
+    def _install(self, categories: List[dict]):
+        models = tuple(Category.model_validate(category) for category in categories)
+        self.categories = models
+        self.ids = frozenset(category.id for category in models)
+        self.version = self._version_of(categories)
+        self.etag = f'W/"{self.version}"'
+        self.body = dumps_json([category.model_dump(mode="json") for category in models])
+
+    @staticmethod
+    def _version_of(categories: List[dict]) -> str:
+        identity = [[category.get("id"), category.get("name"), category.get("description")] for category in categories]
+        return hashlib.blake2b(json.dumps(identity).encode(), digest_size=12).hexdigest()
+
+category_catalog = CategoryCatalog(DEFAULT_CATEGORIES, CATEGORY_CATALOG_REFRESH_SECONDS)
+
+async def run_category_refresher():
+    """Reload the category catalog periodically until cancelled"""
+    while True:
+        await asyncio.sleep(category_catalog.refresh_seconds)
+        try:
+            await category_catalog.refresh(force=True)
+        except Exception:
+            logger.exception("Category refresh failed")
+
+# Session Cache
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+
+class SessionCache:
+    """Bounded LRU cache of session token -> user, so auth skips Mongo on hot paths.
+
+    Entries live for at most ``ttl_seconds`` and never past the session's own
+    ``expires_at``. The cache is per-process, so the TTL also bounds how long a
+    logout performed in another worker can go unnoticed here.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, deadline = entry
+        if time.monotonic() >= deadline:
+            self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return dict(user)
+
+    def set(self, token: str, user: dict, session_expires_at: datetime):
+        ttl = min(self.ttl_seconds, (session_expires_at - datetime.utcnow()).total_seconds())
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (dict(user), time.monotonic() + ttl)
+        self._tokens_by_user.setdefault(user["id"], set()).add(token)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, token: str):
+        if token in self._entries:
+            self._remove(token)
+
+    def invalidate_user(self, user_id: str):
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _remove(self, token: str):
+        user, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user["id"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user["id"]]
+
+session_cache = SessionCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_TTL_SECONDS)
+
+# Search Index
+SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", "1000"))
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", "300"))
+# Users over either budget are searched with the regex path instead of an index
+SEARCH_INDEX_MAX_DOCS = int(os.getenv("SEARCH_INDEX_MAX_DOCS", "50000"))
+SEARCH_INDEX_MAX_CHARS = int(os.getenv("SEARCH_INDEX_MAX_CHARS", str(64 * 1024 * 1024)))
+# Cap on characters indexed across all users in this process; least recently used go first
+SEARCH_INDEX_MAX_TOTAL_CHARS = int(os.getenv("SEARCH_INDEX_MAX_TOTAL_CHARS", str(512 * 1024 * 1024)))
+SEARCH_TITLE_WEIGHT = 3
+SEARCH_PREFIX_WEIGHT = 0.5  # prefix-only matches rank below exact term matches
+WORD_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return WORD_PATTERN.findall(text.lower())
+
+class PromptSearchIndex:
+    """Inverted index over one user's prompt titles and contents.
+
+    Every query term must match; the last term also matches as a prefix so the
+    index can serve typeahead. Results are ranked by a tf-idf style score with
+    title hits weighted above content hits.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.terms: List[str] = []  # sorted, for prefix lookups
+        self.docs: Dict[str, tuple] = {}  # prompt id -> (category, updated_at, terms, chars)
+        self.chars = 0
+        self.built_at = time.monotonic()
+        self.version = 0  # the user's shared index version when the snapshot was taken
+
+    @classmethod
+    def from_prompts(cls, prompts: List[dict]) -> "PromptSearchIndex":
+        """Build an index from a snapshot, sorting the term list once at the end"""
+        index = cls()
+        for prompt in prompts:
+            index._index(prompt, sort_terms=False)
+        index.terms = sorted(index.postings)
+        return index
+
+    def add(self, prompt: dict):
+        self._discard(prompt["id"])
+        self._index(prompt, sort_terms=True)
+
+    def remove(self, prompt_id: str):
+        self._discard(prompt_id)
+
+    def search(self, query: str, category: Optional[str] = None, limit: int = 100) -> List[str]:
+        """Return ids of matching prompts, best match first"""
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+        
+        total_docs = len(self.docs) or 1
+        scores: Optional[Dict[str, float]] = None
+        for position, term in enumerate(query_terms):
+            if position == len(query_terms) - 1:
+                matched_terms = self._expand_prefix(term)
+            else:
+                matched_terms = [term] if term in self.postings else []
+            
+            term_scores: Dict[str, float] = {}
+            for matched in matched_terms:
+                posting = self.postings[matched]
+                idf = math.log(1 + total_docs / len(posting))
+                if matched != term:
+                    idf *= SEARCH_PREFIX_WEIGHT
+                for prompt_id, weight in posting.items():
+                    term_scores[prompt_id] = term_scores.get(prompt_id, 0.0) + weight * idf
+            
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pid: score + term_scores[pid] for pid, score in scores.items() if pid in term_scores}
+            if not scores:
+                return []
+        
+        if category:
+            scores = {pid: score for pid, score in scores.items() if self.docs[pid][0] == category}
+        
+        min_time = datetime.min
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (item[1], self.docs[item[0]][1] or min_time),
+            reverse=True
+        )
+        return [prompt_id for prompt_id, _ in ranked[:limit]]
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.terms, prefix)
+        matched = []
+        for term in itertools.islice(self.terms, start, None):
+            if not term.startswith(prefix):
+                break
+            matched.append(term)
+        return matched
+
+    def _index(self, prompt: dict, sort_terms: bool):
+        prompt_id = prompt["id"]
+        title = prompt.get("title", "")
+        content = prompt.get("content", "")
+        weights: Dict[str, int] = {}
+        for term in tokenize(title):
+            weights[term] = weights.get(term, 0) + SEARCH_TITLE_WEIGHT
+        for term in tokenize(content):
+            weights[term] = weights.get(term, 0) + 1
+        
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                if sort_terms:
+                    bisect.insort(self.terms, term)
+            posting[prompt_id] = weight
+        chars = len(title) + len(content)
+        self.docs[prompt_id] = (prompt.get("category"), prompt.get("updated_at"), frozenset(weights), chars)
+        self.chars += chars
+
+    def _discard(self, prompt_id: str):
+        doc = self.docs.pop(prompt_id, None)
+        if doc is None:
+            return
+        self.chars -= doc[3]
+        for term in doc[2]:
+            posting = self.postings[term]
+            posting.pop(prompt_id, None)
+            if not posting:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+class SearchIndexRegistry:
+    """Lazily built per-user search indexes, kept current by the prompt write paths.
+
+    Indexes are rebuilt after ``ttl_seconds`` so writes made by other worker
+    processes become searchable within that window. ``invalidate`` bumps a
+    per-user version stored with the user's sync counter, which every process
+    checks on ``get``, so a rebuild requested anywhere applies everywhere. The
+    snapshot is tokenized through the offloader; writes landing meanwhile are
+    replayed on top of it. Users over ``max_docs`` or ``max_chars`` get no index
+    (``get`` returns None) until the TTL passes and they are measured again.
+    """
+
+    def __init__(self, max_users: int, ttl_seconds: float, max_docs: int, max_chars: int, max_total_chars: int):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_docs = max_docs
+        self.max_chars = max_chars
+        self.max_total_chars = max_total_chars
+        self._indexes: "OrderedDict[str, PromptSearchIndex]" = OrderedDict()
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, list] = {}  # user id -> writes made during a build
+        self._oversized: Dict[str, tuple] = {}  # user id -> (when to measure again, version)
+
+    async def get(self, user_id: str) -> Optional[PromptSearchIndex]:
+        version = await self._version(user_id)
+        index = self._fresh(user_id, version)
+        if index is not None or self._is_oversized(user_id, version):
+            return index
+        
+        lock = self._build_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self._fresh(user_id, version)
+            if index is None and not self._is_oversized(user_id, version):
+                index = await self._build(user_id, version)
+        self._build_locks.pop(user_id, None)
+        return index
+
+    async def invalidate(self, user_id: str):
+        """Make every process rebuild the user's index on its next search"""
+        for attempt in range(2):
+            try:
+                await sync_counters_collection.update_one(
+                    {"user_id": user_id}, {"$inc": {"search_version": 1}}, upsert=True
+                )
+                break
+            except DuplicateKeyError:
+                # Raced another first write to create the counter; the retry updates it
+                if attempt:
+                    raise
+        self.drop(user_id)
+
+    def on_upsert(self, prompt: dict):
+        pending = self._pending.get(prompt["user_id"])
+        if pending is not None:
+            pending.append(("upsert", prompt))
+        index = self._indexes.get(prompt["user_id"])
+        if index is not None:
+            index.add(prompt)
+
+    def on_delete(self, user_id: str, prompt_id: str):
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            pending.append(("delete", prompt_id))
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.remove(prompt_id)
+
+    def drop(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self._indexes.clear()
+            self._oversized.clear()
+        else:
+            self._indexes.pop(user_id, None)
+            self._oversized.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._indexes),
+            "chars": sum(index.chars for index in self._indexes.values()),
+            "oversized_users": sum(1 for until, _ in self._oversized.values() if until > time.monotonic()),
+        }
+
+    @staticmethod
+    async def _version(user_id: str) -> int:
+        counter = await sync_counters_collection.find_one({"user_id": user_id}, {"_id": 0, "search_version": 1})
+        return counter.get("search_version", 0) if counter else 0
+
+    def _fresh(self, user_id: str, version: int) -> Optional[PromptSearchIndex]:
+        index = self._indexes.get(user_id)
+        if index is None or index.version != version or time.monotonic() - index.built_at > self.ttl_seconds:
+            return None
+        self._indexes.move_to_end(user_id)
+        return index
+
+    def _is_oversized(self, user_id: str, version: int) -> bool:
+        until, oversized_version = self._oversized.get(user_id, (0, None))
+        return oversized_version == version and until > time.monotonic()
+
+    async def _build(self, user_id: str, version: int) -> Optional[PromptSearchIndex]:
+        self._oversized.pop(user_id, None)
+        if await prompts_collection.count_documents({"user_id": user_id}) > self.max_docs:
+            return self._mark_oversized(user_id, version)
+        
+        pending = self._pending[user_id] = []
+        try:
+            prompts = []
+            chars = 0
+            cursor = prompts_collection.find(
+                {"user_id": user_id},
+                {"_id": 0, "id": 1, "title": 1, "content": 1, "category": 1, "updated_at": 1}
+            )
+            async for prompt in cursor:
+                chars += len(prompt.get("title", "")) + len(prompt.get("content", ""))
+                if chars > self.max_chars or len(prompts) >= self.max_docs:
+                    return self._mark_oversized(user_id, version)
+                prompts.append(prompt)
+            
+            index = await offloader.run(chars, PromptSearchIndex.from_prompts, prompts)
+            # Writes made while the snapshot loaded win over what it read
+            for action, payload in pending:
+                if action == "upsert":
+                    index.add(payload)
+                else:
+                    index.remove(payload)
+        finally:
+            self._pending.pop(user_id, None)
+        
+        index.built_at = time.monotonic()
+        index.version = version
+        self._indexes[user_id] = index
+        self._indexes.move_to_end(user_id)
+        total_chars = sum(entry.chars for entry in self._indexes.values())
+        while len(self._indexes) > 1 and (
+            len(self._indexes) > self.max_users or total_chars > self.max_total_chars
+        ):
+            _, evicted = self._indexes.popitem(last=False)
+            total_chars -= evicted.chars
+        return index
+
+    def _mark_oversized(self, user_id: str, version: int) -> None:
+        self._indexes.pop(user_id, None)
+        self._oversized[user_id] = (time.monotonic() + self.ttl_seconds, version)
+        return None
+
+search_indexes = SearchIndexRegistry(
+    SEARCH_INDEX_MAX_USERS, SEARCH_INDEX_TTL_SECONDS,
+    SEARCH_INDEX_MAX_DOCS, SEARCH_INDEX_MAX_CHARS, SEARCH_INDEX_MAX_TOTAL_CHARS
+)
 
 # Helper Functions
+VARIABLE_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
 def extract_variables(content: str) -> List[str]:
     """Extract {{variable}} placeholders from prompt content"""
-    import re
-    pattern = r'\{\{(\w+)\}\}'
-    return list(set(re.findall(pattern, content)))
+    names = set()
+    for piece in placeholder_pieces(content):
+        names.update(VARIABLE_PATTERN.findall(piece))
+    return list(names)
+
+def utc_now() -> datetime:
+    """Current UTC time truncated to the millisecond precision Mongo stores"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def prompt_etag(prompt: dict) -> str:
+    """Strong ETag for a single prompt, derived from its updated_at"""
+    return f'"{prompt["updated_at"].isoformat()}"'
+
+def parse_prompt_etag(etag: str) -> Optional[datetime]:
+    """Recover the updated_at encoded by prompt_etag, or None if it isn't one of ours"""
+    value = etag.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return datetime.fromisoformat(value.strip('"'))
+    except ValueError:
+        return None
+
+# Offloading
+# Parsing and rendering inputs above OFFLOAD_THRESHOLD_CHARS run on a bounded
+# executor instead of the event loop. "thread" still shares the GIL, and the loop
+# only gets it back between bytecodes, never in the middle of one C call such as a
+# regex split or a JSON encode. Offloaded work therefore handles large strings
+# OFFLOAD_PIECE_CHARS at a time; what remains are plain copies like the final
+# join. "process" avoids the GIL at the cost of pickling the inputs; "none" keeps
+# everything inline.
+OFFLOAD_EXECUTOR = os.getenv("OFFLOAD_EXECUTOR", "thread")
+OFFLOAD_THRESHOLD_CHARS = int(os.getenv("OFFLOAD_THRESHOLD_CHARS", "262144"))
+OFFLOAD_PIECE_CHARS = int(os.getenv("OFFLOAD_PIECE_CHARS", "65536"))
+OFFLOAD_MAX_WORKERS = int(os.getenv("OFFLOAD_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+OFFLOAD_MAX_PENDING = int(os.getenv("OFFLOAD_MAX_PENDING", "16"))
+OFFLOAD_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OFFLOAD_QUEUE_TIMEOUT_SECONDS", "5"))
+
+offload_calls = LabeledCounter(
+    "contextos_offload_calls_total",
+    "CPU-heavy calls by where they ran; rejected calls found the offload queue full",
+    ("mode",)
+)
+
+# A placeholder is made of braces and word characters only, so cutting right
+# after any other character can't split one
+PLACEHOLDER_SAFE_CUT = re.compile(r"[^\w{}]")
+
+def placeholder_pieces(content: str, piece_chars: int = OFFLOAD_PIECE_CHARS):
+    """Yield consecutive slices of about ``piece_chars`` that never split a {{variable}}"""
+    start = 0
+    while len(content) - start > piece_chars:
+        cut = PLACEHOLDER_SAFE_CUT.search(content, start + piece_chars)
+        if cut is None:
+            break
+        yield content[start:cut.end()]
+        start = cut.end()
+    yield content[start:]
+
+def dumps_json_text(text: str, piece_chars: int = OFFLOAD_PIECE_CHARS) -> bytes:
+    """JSON-encode a string a piece at a time; escaping is per character, so pieces concatenate"""
+    if len(text) <= piece_chars:
+        return dumps_json(text)
+    pieces = (dumps_json(text[start:start + piece_chars])[1:-1] for start in range(0, len(text), piece_chars))
+    return b'"' + b"".join(pieces) + b'"'
+
+class Offloader:
+    """Runs large CPU-bound calls on a bounded executor instead of the event loop.
+
+    Calls on the thread executor still contend for the GIL (see above), so
+    offloaded functions should work through large inputs in pieces. At most ``max_pending`` calls are queued or running at once; further callers
+    wait up to ``queue_timeout`` seconds for a slot and then get a 503. The
+    executor is created per process in ``start`` (after uvicorn forks workers).
+    """
+
+    def __init__(self, kind: str, threshold: int, max_workers: int, max_pending: int, queue_timeout: float):
+        self.kind = kind
+        self.threshold = threshold
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._executor = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        if self.kind == "process":
+            # spawn, not fork: a forked child would inherit the event loop and Mongo client
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        elif self.kind == "thread":
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix="offload")
+        self._slots = asyncio.Semaphore(self.max_pending)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, size: int, func, *args):
+        """Call ``func(*args)``, on the executor when ``size`` (in characters) reaches the threshold"""
+        if self._executor is None or size < self.threshold:
+            offload_calls.inc(("inline",))
+            return func(*args)
+        
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            offload_calls.inc(("rejected",))
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy with large requests; retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        self.in_flight += 1
+        try:
+            offload_calls.inc((self.kind,))
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+offloader = Offloader(
+    OFFLOAD_EXECUTOR, OFFLOAD_THRESHOLD_CHARS, OFFLOAD_MAX_WORKERS, OFFLOAD_MAX_PENDING, OFFLOAD_QUEUE_TIMEOUT_SECONDS
+)
+
+# Templates
+TEMPLATE_CACHE_MAX_ENTRIES = int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "2000"))
+
+class CompiledTemplate:
+    """Prompt content parsed once into literal chunks and variable slots.
+
+    ``parts`` alternates literal text (even indices) and variable names (odd
+    indices), so rendering is a single join regardless of how many variables
+    are supplied. Placeholders without a supplied value are left as-is.
+    """
+
+    __slots__ = ("parts", "variables", "literal_chars", "slot_counts")
+
+    def __init__(self, content: str):
+        parts = []
+        literal = []  # fragments of the literal still being assembled across pieces
+        for piece in placeholder_pieces(content):
+            piece_parts = VARIABLE_PATTERN.split(piece)
+            literal.append(piece_parts[0])
+            if len(piece_parts) > 1:
+                parts.append("".join(literal))
+                parts.extend(piece_parts[1:-1])
+                literal = [piece_parts[-1]]
+        parts.append("".join(literal))
+        self.parts = parts
+        self.variables = frozenset(self.parts[1::2])
+        self.literal_chars = sum(len(part) for part in self.parts[::2])
+        self.slot_counts = Counter(self.parts[1::2])
+
+    def output_size(self, values: Dict[str, str]) -> int:
+        """Length of ``render(values)`` without rendering"""
+        size = self.literal_chars
+        for name, count in self.slot_counts.items():
+            value = values.get(name)
+            size += count * (len(value) if value is not None else len(name) + 4)
+        return size
+
+    def render(self, values: Dict[str, str]) -> str:
+        parts = self.parts[:]
+        for slot in range(1, len(parts), 2):
+            name = parts[slot]
+            value = values.get(name)
+            parts[slot] = value if value is not None else "{{" + name + "}}"
+        return "".join(parts)
+
+    def iter_render(self, values: Dict[str, str], chunk_size: int):
+        """Yield the rendered output in pieces of at most ``chunk_size`` characters.
+
+        Small parts are batched into one piece and long ones are sliced, so the
+        output never has to exist as a single string.
+        """
+        buffer = []
+        size = 0
+        for slot, text in enumerate(self.parts):
+            if slot % 2:
+                value = values.get(text)
+                text = value if value is not None else "{{" + text + "}}"
+            start = 0
+            while start < len(text):
+                piece = text[start:start + chunk_size - size]
+                buffer.append(piece)
+                size += len(piece)
+                start += len(piece)
+                if size >= chunk_size:
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+        if buffer:
+            yield "".join(buffer)
+
+    def check(self, values: Dict[str, str]) -> tuple:
+        """Return (missing, unused) variable names for a set of values"""
+        missing = sorted(self.variables.difference(values))
+        unused = sorted(set(values).difference(self.variables))
+        return missing, unused
+
+class TemplateCache:
+    """LRU of compiled templates, one entry per prompt, valid for a single ``updated_at``"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prompt_id: str, updated_at: datetime) -> Optional[CompiledTemplate]:
+        entry = self._entries.get(prompt_id)
+        if entry is None or entry[0] != updated_at:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(prompt_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, prompt_id: str, updated_at: datetime, template: CompiledTemplate):
+        if self.max_entries <= 0:
+            return
+        self._entries[prompt_id] = (updated_at, template)
+        self._entries.move_to_end(prompt_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, prompt_id: str):
+        self._entries.pop(prompt_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+template_cache = TemplateCache(TEMPLATE_CACHE_MAX_ENTRIES)
+
+async def load_template(prompt_id: str, user_id: str) -> CompiledTemplate:
+    """Fetch a user's prompt as a compiled template, reusing the cache when unchanged.
+
+    A hit costs one projected ``updated_at`` read and no content transfer, and
+    always reflects writes made by other workers.
+    """
+    query = {"id": prompt_id, "user_id": user_id}
+    stamp = await prompts_collection.find_one(query, {"_id": 0, "updated_at": 1})
+    if not stamp:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    
+    template = template_cache.get(prompt_id, stamp["updated_at"])
+    if template is not None:
+        return template
+    
+    prompt = await prompts_collection.find_one(query, {"_id": 0, "content": 1, "updated_at": 1})
+    if not prompt:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    template = await offloader.run(len(prompt["content"]), CompiledTemplate, prompt["content"])
+    template_cache.put(prompt_id, prompt["updated_at"], template)
+    return template
+
+# Version History
+# Revisions are stored as line deltas against the previous version, with a full
+# snapshot every PROMPT_VERSION_SNAPSHOT_INTERVAL versions (or whenever the delta
+# wouldn't be smaller), so rebuilding any version replays a bounded number of deltas.
+PROMPT_VERSION_SNAPSHOT_INTERVAL = int(os.getenv("PROMPT_VERSION_SNAPSHOT_INTERVAL", "20"))
+PROMPT_VERSION_DIFF_MAX_LINES = int(os.getenv("PROMPT_VERSION_DIFF_MAX_LINES", "4000"))
+
+def diff_lines(old: str, new: str) -> Optional[List[list]]:
+    """Encode ``new`` as ops against ``old``: ["=", n] keep, ["-", n] drop, ["+", lines] insert.
+
+    Returns None when the changed region spans more than
+    PROMPT_VERSION_DIFF_MAX_LINES lines, so the caller stores a snapshot instead.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    if old_lines == new_lines:
+        return [["=", len(old_lines)]] if old_lines else []
+    
+    # Only the region between the common prefix and suffix needs matching
+    shortest = min(len(old_lines), len(new_lines))
+    prefix = 0
+    while prefix < shortest and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    old_middle = old_lines[prefix:len(old_lines) - suffix]
+    new_middle = new_lines[prefix:len(new_lines) - suffix]
+    if len(old_middle) + len(new_middle) > PROMPT_VERSION_DIFF_MAX_LINES:
+        return None
+    
+    delta = [["=", prefix]] if prefix else []
+    # autojunk stays on: without it, repeated lines ("}", blanks) make matching near-quadratic
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(["=", i2 - i1])
+            continue
+        if i2 > i1:
+            delta.append(["-", i2 - i1])
+        if j2 > j1:
+            delta.append(["+", new_middle[j1:j2]])
+    if suffix:
+        delta.append(["=", suffix])
+    return delta
+
+def apply_delta(base: str, delta: List[list]) -> str:
+    """Rebuild a revision from the previous version's content and its delta"""
+    base_lines = base.splitlines(keepends=True)
+    position = 0
+    out = []
+    for op, arg in delta:
+        if op == "=":
+            out.extend(base_lines[position:position + arg])
+            position += arg
+        elif op == "-":
+            position += arg
+        else:
+            out.extend(arg)
+    return "".join(out)
+
+def build_version_document(prompt: Dict[str, Any], version: int, previous_content: Optional[str]) -> Dict[str, Any]:
+    """History entry for ``prompt`` as ``version``, delta-encoded against the previous content when worthwhile"""
+    document = {
+        "prompt_id": prompt["id"],
+        "user_id": prompt["user_id"],
+        "version": version,
+        "title": prompt["title"],
+        "category": prompt["category"],
+        "created_at": prompt["updated_at"],
+    }
+    if previous_content is not None and version % PROMPT_VERSION_SNAPSHOT_INTERVAL != 0:
+        delta = diff_lines(previous_content, prompt["content"])
+        if delta is not None and len(dumps_json(delta)) < len(prompt["content"]):
+            document["delta"] = delta
+            return document
+    document["content"] = prompt["content"]
+    return document
+
+async def load_prompt_version(prompt_id: str, user_id: str, version: int) -> Dict[str, Any]:
+    """Reconstruct one version from the nearest snapshot at or below it"""
+    # Snapshots are never more than one interval apart, so one bounded range covers the chain
+    window_start = max(0, version - PROMPT_VERSION_SNAPSHOT_INTERVAL)
+    chain = await (
+        prompt_versions_collection.find(
+            {"prompt_id": prompt_id, "user_id": user_id, "version": {"$gte": window_start, "$lte": version}},
+            {"_id": 0}
+        )
+        .sort("version", ASCENDING)
+        .to_list(None)
+    )
+    if not chain or chain[-1]["version"] != version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    start = max((i for i, entry in enumerate(chain) if "content" in entry), default=None)
+    if start is None or chain[-1]["version"] - chain[start]["version"] != len(chain) - 1 - start:
+        # A missing entry breaks the delta chain; report it rather than guess
+        raise HTTPException(status_code=404, detail="Version history is incomplete")
+    
+    content = chain[start]["content"]
+    for entry in chain[start + 1:]:
+        content = apply_delta(content, entry["delta"])
+    
+    target = chain[-1]
+    return {
+        "prompt_id": prompt_id,
+        "version": version,
+        "title": target["title"],
+        "category": target["category"],
+        "content": content,
+        "variables": extract_variables(content),
+        "created_at": target["created_at"],
+    }
+
+# Pagination
+PROMPT_FIELDS = ("id", "title", "content", "category", "variables", "user_id", "created_at", "updated_at")
+PROMPT_LIST_MAX_LIMIT = 500
+# Everything the Prompt model returns, so the fast path emits the same fields
+PROMPT_PROJECTION = {"_id": 0, **{field: 1 for field in PROMPT_FIELDS}}
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode a list position as an opaque URL-safe cursor"""
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def build_projection(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """Turn a comma-separated ``fields`` parameter into a Mongo projection"""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(PROMPT_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # id and updated_at are always needed to address the prompt and build the next cursor
+    projection = {"_id": 0, "id": 1, "updated_at": 1}
+    projection.update({field: 1 for field in requested})
+    return projection
+
+# Conditional Requests
+# Clients may store list responses but must revalidate them on every use
+LIST_CACHE_CONTROL = "private, no-cache"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    
+    return any(opaque(candidate) == opaque(etag) for candidate in if_none_match.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
+
+async def prompt_list_etag(user_id: str, request: Request) -> str:
+    """Weak ETag for a prompt list response: the user's latest change, prompt count and query"""
+    latest, count = await asyncio.gather(
+        prompts_collection.find_one(
+            {"user_id": user_id},
+            {"_id": 0, "updated_at": 1},
+            sort=[("updated_at", -1), ("id", -1)]
+        ),
+        prompts_collection.count_documents({"user_id": user_id})
+    )
+    latest_stamp = latest["updated_at"].isoformat() if latest else ""
+    params = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    digest = hashlib.blake2b(f"{latest_stamp}|{count}|{params}".encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+# Change Tracking
+# Every prompt write takes the next value of a per-user sequence and deletes leave
+# a tombstone carrying theirs, so a sync token only needs the last sequence seen.
+# Sequence numbers are reserved before the write lands, so writes can commit out
+# of order; a token only moves past a change once it is older than the safety
+# window, by which time every lower number has committed (or its write failed).
+PROMPT_TOMBSTONE_RETENTION_DAYS = int(os.getenv("PROMPT_TOMBSTONE_RETENTION_DAYS", "30"))
+SYNC_SAFETY_WINDOW_SECONDS = float(os.getenv("SYNC_SAFETY_WINDOW_SECONDS", "30"))
+
+async def next_change_seq(user_id: str, count: int = 1) -> int:
+    """Reserve ``count`` change sequence numbers for a user, returning the highest"""
+    for attempt in range(2):
+        try:
+            counter = await sync_counters_collection.find_one_and_update(
+                {"user_id": user_id},
+                {"$inc": {"seq": count}},
+                projection={"_id": 0, "seq": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return counter["seq"]
+        except DuplicateKeyError:
+            # Two first writes raced to create the counter; the retry updates the winner's
+            if attempt:
+                raise
+
+def encode_sync_token(seq: int, issued_at: float, page_seq: Optional[int] = None) -> str:
+    position = {"s": seq, "t": int(issued_at)}
+    if page_seq is not None and page_seq > seq:
+        position["p"] = page_seq
+    return encode_cursor(position)
+
+def decode_sync_token(token: str) -> tuple:
+    """Return (seq, page_seq, issued_at), rejecting tokens older than the tombstone retention.
+
+    ``seq`` is the committed watermark; ``page_seq`` is where a partial page
+    stopped, so the next page starts there while a later token still rereads
+    everything above the watermark.
+    """
+    try:
+        position = decode_cursor(token)
+    except HTTPException:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    seq, issued_at = position.get("s"), position.get("t")
+    page_seq = position.get("p", seq)
+    if not all(isinstance(value, int) for value in (seq, issued_at, page_seq)):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    if time.time() - issued_at > PROMPT_TOMBSTONE_RETENTION_DAYS * 86400:
+        # Deletes older than this may already be forgotten, so only a full reload is safe
+        raise HTTPException(status_code=410, detail="Sync token expired; reload the prompt list")
+    return seq, page_seq, issued_at
+
+def sync_safety_cutoff() -> datetime:
+    """Changes stamped at or before this time have no uncommitted lower sequence numbers"""
+    return datetime.utcnow() - timedelta(seconds=SYNC_SAFETY_WINDOW_SECONDS)
+
+async def committed_change_seq(user_id: str) -> int:
+    """Highest change sequence below which every write has landed"""
+    cutoff = sync_safety_cutoff()
+    latest = await asyncio.gather(
+        prompts_collection.find_one(
+            {"user_id": user_id, "updated_at": {"$lte": cutoff}, "change_seq": {"$exists": True}},
+            {"_id": 0, "change_seq": 1},
+            sort=[("change_seq", DESCENDING)]
+        ),
+        prompt_tombstones_collection.find_one(
+            {"user_id": user_id, "deleted_at": {"$lte": cutoff}},
+            {"_id": 0, "change_seq": 1},
+            sort=[("change_seq", DESCENDING)]
+        )
+    )
+    return max((entry["change_seq"] for entry in latest if entry), default=0)
+
+# Prompt Stats
+# One document per user holding prompt counts by category and by variable, kept
+# current with $inc on every write; rebuild_prompt_stats recounts from scratch.
+PROMPT_STATS_TOP_VARIABLES = 20
+
+def prompt_stats_delta(before: Optional[dict], after: Optional[dict]) -> tuple:
+    """Return (total, categories, variables) count changes for replacing ``before`` with ``after``"""
+    categories = Counter()
+    variables = Counter()
+    for prompt, sign in ((before, -1), (after, 1)):
+        if prompt:
+            categories[prompt["category"]] += sign
+            for name in prompt.get("variables", ()):
+                variables[name] += sign
+    return bool(after) - bool(before), categories, variables
+
+async def apply_prompt_stats_delta(user_id: str, total: int, categories: Counter, variables: Counter):
+    increments = {f"categories.{name}": count for name, count in categories.items() if count}
+    increments.update({f"variables.{name}": count for name, count in variables.items() if count})
+    if total:
+        increments["total"] = total
+    if not increments:
+        return
+    for attempt in range(2):
+        try:
+            await prompt_stats_collection.update_one({"user_id": user_id}, {"$inc": increments}, upsert=True)
+            return
+        except DuplicateKeyError:
+            # Two first writes raced to create the document; the retry updates the winner's
+            if attempt:
+                raise
+
+def summarize_prompt_stats(stats: Dict[str, Any], top_variables: int) -> Dict[str, Any]:
+    """Public view of a stats document, leaving out zero counts"""
+    variables = Counter({name: count for name, count in stats.get("variables", {}).items() if count > 0})
+    return {
+        "total": stats.get("total", 0),
+        "categories": {name: count for name, count in stats.get("categories", {}).items() if count > 0},
+        "top_variables": [{"name": name, "count": count} for name, count in variables.most_common(top_variables)]
+    }
+
+async def rebuild_prompt_stats(user_id: str) -> Dict[str, Any]:
+    """Recount a user's stats from their prompts and replace the stored document.
+
+    Zero counts left behind by incremental updates are dropped. A write landing
+    while the recount runs may be missed until the next rebuild.
+    """
+    started = datetime.utcnow()
+    by_category, by_variable = await asyncio.gather(
+        prompts_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+        ]).to_list(None),
+        prompts_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$unwind": "$variables"},
+            {"$group": {"_id": "$variables", "count": {"$sum": 1}}},
+        ]).to_list(None)
+    )
+    stats = {
+        "user_id": user_id,
+        "total": sum(row["count"] for row in by_category),
+        "categories": {row["_id"]: row["count"] for row in by_category},
+        "variables": {row["_id"]: row["count"] for row in by_variable},
+        "rebuilt_at": started,
+    }
+    await prompt_stats_collection.replace_one({"user_id": user_id}, stats, upsert=True)
+    return stats
 
 async def get_current_user(x_session_id: Optional[str] = Header(None)):
     """Dependency to get current authenticated user"""
     if not x_session_id:
         raise HTTPException(status_code=401, detail="Session ID required")
     
+    cached_user = session_cache.get(x_session_id)
+    if cached_user is not None:
+        return cached_user
+    
     session = await sessions_collection.find_one({"session_token": x_session_id})
     if not session or datetime.utcnow() > session["expires_at"]:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
     
-    user = await users_collection.find_one({"id": session["user_id"]})
+    user = await users_collection.find_one({"id": session["user_id"]}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
+    session_cache.set(x_session_id, user, session["expires_at"])
     return user
 
-# Initialize default categories
+# Rate Limiting
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Where the login budget finds the client's IP: "peer" for the socket address when
+# clients connect directly, "forwarded" for X-Forwarded-For set by a proxy we control
+# (clients could spoof it otherwise). Unset, the login budget is off: behind an
+# ingress the peer is the proxy, and every login would share its bucket.
+RATE_LIMIT_CLIENT_IP = os.getenv("RATE_LIMIT_CLIENT_IP", "").lower()
+RATE_LIMIT_MAX_CONCURRENT_HEAVY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENT_HEAVY", "2"))
+
+def parse_rate_budget(env_name: str, default: str) -> tuple:
+    """Read a ``rate/burst`` budget (tokens per second / bucket size) from the environment"""
+    rate, _, burst = os.getenv(env_name, default).partition("/")
+    return float(rate), float(burst or rate)
+
+RATE_LIMIT_BUDGETS = {
+    "login": parse_rate_budget("RATE_LIMIT_LOGIN", "1/10"),  # keyed by client IP, see RATE_LIMIT_CLIENT_IP
+    "search": parse_rate_budget("RATE_LIMIT_SEARCH", "5/20"),
+    "generate": parse_rate_budget("RATE_LIMIT_GENERATE", "20/60"),
+    "batch": parse_rate_budget("RATE_LIMIT_BATCH", "0.2/3"),
+    "bulk": parse_rate_budget("RATE_LIMIT_BULK", "0.1/2"),
+    "jobs": parse_rate_budget("RATE_LIMIT_JOBS", "0.5/5"),
+}
+
+rate_limit_rejections = LabeledCounter(
+    "contextos_rate_limit_rejections_total",
+    "Requests rejected by rate or concurrency limits",
+    ("budget",)
+)
+
+class RateLimitBackend(abc.ABC):
+    """Token bucket storage. The in-memory backend only limits within one process;
+    multi-worker deployments can assign ``rate_limit_backend`` an implementation
+    backed by a shared store with the same ``acquire`` contract."""
+
+    @abc.abstractmethod
+    async def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; return 0 if granted, else seconds until they would be"""
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last refill]
+
+    async def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            # Dropping the least recently used bucket is safe: a new one starts full
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / rate
+
+class ConcurrencyLimiter:
+    """Caps simultaneous long-running requests per key within this process"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active: Dict[str, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: str, budget: str):
+        if self._active.get(key, 0) >= self.limit:
+            rate_limit_rejections.inc((budget,))
+            raise HTTPException(
+                status_code=429,
+                detail="Too many concurrent requests",
+                headers={"Retry-After": "1"}
+            )
+        self._active[key] = self._active.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+
+rate_limit_backend: RateLimitBackend = InMemoryRateLimitBackend()
+heavy_request_limiter = ConcurrencyLimiter(RATE_LIMIT_MAX_CONCURRENT_HEAVY)
+
+async def enforce_rate_limit(budget: str, key: str, cost: float = 1.0):
+    """Charge ``key``'s bucket for ``budget``, raising 429 with Retry-After when empty"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    rate, capacity = RATE_LIMIT_BUDGETS[budget]
+    if rate <= 0:
+        return
+    retry_after = await rate_limit_backend.acquire(f"{budget}:{key}", rate, capacity, cost)
+    if retry_after > 0:
+        rate_limit_rejections.inc((budget,))
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+def rate_limited(budget: str, heavy: bool = False):
+    """Dependency factory: authenticate, charge the user's ``budget`` and, for heavy
+    routes, hold one of the user's concurrent request slots until the response is done"""
+    async def dependency(current_user: dict = Depends(get_current_user)):
+        await enforce_rate_limit(budget, current_user["id"])
+        if not heavy or not RATE_LIMIT_ENABLED:
+            yield current_user
+            return
+        async with heavy_request_limiter.slot(current_user["id"], budget):
+            yield current_user
+    return dependency
+
+def client_address(request: Request) -> Optional[str]:
+    """The client IP per RATE_LIMIT_CLIENT_IP, or None when it isn't configured"""
+    if RATE_LIMIT_CLIENT_IP not in ("peer", "forwarded"):
+        return None
+    if RATE_LIMIT_CLIENT_IP == "forwarded":
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+# Indexes
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))  # finished jobs and their results
+
+COLLECTION_INDEXES = {
+    "sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        # Expired sessions are removed by the server's TTL monitor
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "prompts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Keyset pagination walks (updated_at, id) newest first, optionally within a category
+        IndexModel(
+            [("user_id", ASCENDING), ("category", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)],
+            name="user_category_updated_id",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)],
+            name="user_updated_id",
+        ),
+        IndexModel([("user_id", ASCENDING), ("change_seq", ASCENDING)], name="user_change_seq"),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "prompt_versions": [
+        IndexModel([("prompt_id", ASCENDING), ("version", DESCENDING)], name="prompt_version_unique", unique=True),
+    ],
+    "prompt_tombstones": [
+        IndexModel([("user_id", ASCENDING), ("change_seq", ASCENDING)], name="user_change_seq"),
+        IndexModel(
+            [("deleted_at", ASCENDING)],
+            name="deleted_at_ttl",
+            expireAfterSeconds=PROMPT_TOMBSTONE_RETENTION_DAYS * 86400,
+        ),
+    ],
+    "sync_counters": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "prompt_stats": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Workers claim the oldest queued (or stale running) job
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)], name="user_status"),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=JOB_RETENTION_HOURS * 3600),
+    ],
+    "job_results": [
+        # Chunks carry the claim that wrote them; only the final claim's are read
+        IndexModel([("job_id", ASCENDING), ("claim", ASCENDING), ("seq", ASCENDING)], name="job_claim_seq"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=JOB_RETENTION_HOURS * 3600),
+    ],
+}
+
+async def dedupe_sessions() -> int:
+    """Delete duplicate session tokens left by older logins, keeping the latest expiry"""
+    removed = 0
+    duplicates = sessions_collection.aggregate([
+        {"$sort": {"session_token": 1, "expires_at": -1}},
+        {"$group": {"_id": "$session_token", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    async for group in duplicates:
+        result = await sessions_collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+    return removed
+
+# Legacy data that can block a unique index, and how to clear it
+INDEX_DEDUPERS = {("sessions", "session_token_unique"): dedupe_sessions}
+
+async def ensure_indexes():
+    """Create the indexes the API's queries rely on (safe to run repeatedly).
+
+    Each index is created on its own so one that can't be built (say, a unique
+    index over duplicate legacy data) doesn't take the others down with it.
+    """
+    for collection_name, indexes in COLLECTION_INDEXES.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection_name].create_indexes([index])
+            except OperationFailure as exc:
+                dedupe = INDEX_DEDUPERS.get((collection_name, name))
+                if exc.code == 11000 and dedupe is not None:
+                    removed = await dedupe()
+                    logger.warning("Removed %d duplicate documents from %s before indexing", removed, collection_name)
+                    try:
+                        await db[collection_name].create_indexes([index])
+                        continue
+                    except OperationFailure as retry_exc:
+                        exc = retry_exc
+                # Typically duplicate legacy data or an index with conflicting options;
+                # keep serving and let an operator resolve it.
+                logger.warning("Could not create index %s on %s: %s", name, collection_name, exc)
+
+# Session Sweeper
+# The TTL index already expires sessions, but its monitor runs on its own schedule
+# and is skipped entirely when the index couldn't be built; this task bounds the
+# backlog either way. Every worker runs it; the deletes are idempotent.
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "1000"))
+# A repeated login within this window of the last refresh doesn't rewrite the session
+SESSION_REFRESH_COALESCE_SECONDS = float(os.getenv("SESSION_REFRESH_COALESCE_SECONDS", "300"))
+SESSION_LIFETIME = timedelta(days=7)
+
+background_tasks: List[asyncio.Task] = []
+
+async def purge_expired_sessions(batch_size: int = SESSION_SWEEP_BATCH_SIZE) -> int:
+    """Delete expired sessions in bounded batches; returns the number removed"""
+    removed = 0
+    while True:
+        expired = await (
+            sessions_collection.find({"expires_at": {"$lt": datetime.utcnow()}}, {"_id": 1})
+            .limit(batch_size)
+            .to_list(batch_size)
+        )
+        if not expired:
+            break
+        result = await sessions_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in expired]}})
+        removed += result.deleted_count
+        if len(expired) < batch_size:
+            break
+        # Let interactive requests in between batches of a large backlog
+        await asyncio.sleep(0.1)
+    return removed
+
+async def run_session_sweeper():
+    """Purge expired sessions periodically until cancelled"""
+    while True:
+        # Jitter keeps workers started together from sweeping in lockstep
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS * random.uniform(0.5, 1.5))
+        try:
+            removed = await purge_expired_sessions()
+            if removed:
+                logger.info("Purged %d expired sessions", removed)
+        except Exception:
+            logger.exception("Session sweep failed")
+
+# Auth Service Client
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "https://demobackend.emergentagent.com")
+AUTH_SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+AUTH_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AUTH_CONNECT_TIMEOUT_SECONDS", "3"))
+AUTH_READ_TIMEOUT_SECONDS = float(os.getenv("AUTH_READ_TIMEOUT_SECONDS", "10"))
+AUTH_MAX_CONNECTIONS = int(os.getenv("AUTH_MAX_CONNECTIONS", "20"))
+AUTH_MAX_CONCURRENCY = int(os.getenv("AUTH_MAX_CONCURRENCY", "50"))
+AUTH_MAX_RETRIES = int(os.getenv("AUTH_MAX_RETRIES", "2"))
+AUTH_RETRY_BACKOFF_SECONDS = float(os.getenv("AUTH_RETRY_BACKOFF_SECONDS", "0.2"))
+
+auth_http_client: Optional[httpx.AsyncClient] = None
+# Bounds in-flight upstream calls during login storms; extra callers wait their turn.
+# Created at startup so it belongs to the running event loop.
+auth_request_slots: Optional[asyncio.Semaphore] = None
+
+def get_auth_http_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive client for the auth service, creating it on first use"""
+    global auth_http_client
+    if auth_http_client is None or auth_http_client.is_closed:
+        auth_http_client = httpx.AsyncClient(
+            base_url=AUTH_SERVICE_URL,
+            timeout=httpx.Timeout(AUTH_READ_TIMEOUT_SECONDS, connect=AUTH_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=AUTH_MAX_CONNECTIONS,
+                max_keepalive_connections=AUTH_MAX_CONNECTIONS,
+                keepalive_expiry=60
+            )
+        )
+    return auth_http_client
+
+async def fetch_session_data(session_id: str) -> httpx.Response:
+    """Fetch session data from the auth service, retrying transport errors and 5xx with backoff"""
+    async with auth_request_slots:
+        for attempt in range(AUTH_MAX_RETRIES + 1):
+            try:
+                response = await get_auth_http_client().get(
+                    AUTH_SESSION_DATA_PATH,
+                    headers={"X-Session-ID": session_id}
+                )
+            except httpx.TransportError:
+                if attempt == AUTH_MAX_RETRIES:
+                    raise
+            else:
+                if response.status_code < 500 or attempt == AUTH_MAX_RETRIES:
+                    return response
+            # Exponential backoff with jitter so retrying workers don't synchronize
+            await asyncio.sleep(AUTH_RETRY_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+
+async def seed_default_categories():
+    """Insert any missing default categories in one round trip.
+
+    Upserts with $setOnInsert make this safe to run from every worker at once
+    and never overwrite categories that were edited after seeding.
+    """
+    operations = [
+        UpdateOne({"id": category["id"]}, {"$setOnInsert": dict(category)}, upsert=True)
+        for category in DEFAULT_CATEGORIES
+    ]
+    try:
+        await categories_collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as exc:
+        # Concurrent upserts of the same id can race on the unique index; the loser's
+        # duplicate key error just means another worker seeded it first.
+        if any(error.get("code") != 11000 for error in exc.details.get("writeErrors", [])):
+            raise
+
+# Initialize indexes and default categories
 @app.on_event("startup")
 async def startup_event():
-    for category in DEFAULT_CATEGORIES:
-        existing = await categories_collection.find_one({"id": category["id"]})
-        if not existing:
-            await categories_collection.insert_one(category)
+    global auth_request_slots
+    auth_request_slots = asyncio.Semaphore(AUTH_MAX_CONCURRENCY)
+    await ensure_indexes()
+    await seed_default_categories()
+    await category_catalog.refresh(force=True)
+    if CATEGORY_CATALOG_REFRESH_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_category_refresher()))
+    if SESSION_SWEEP_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_session_sweeper()))
+    offloader.start()
+    start_job_workers()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    offloader.shutdown()
+    if auth_http_client is not None:
+        await auth_http_client.aclose()
+    client.close()
 
 # Authentication Routes
 @app.post("/api/auth/session")
-async def create_session(x_session_id: str = Header(...)):
+async def create_session(request: Request, x_session_id: str = Header(...)):
     """Authenticate user with Emergent auth service"""
+    address = client_address(request)
+    if address is not None:
+        await enforce_rate_limit("login", address)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": x_session_id}
-            )
+        response = await fetch_session_data(x_session_id)
         
         if response.status_code != 200:
             raise HTTPException(status_code=401, detail="Invalid session")
         
         auth_data = response.json()
         
-        # Check if user exists
-        existing_user = await users_collection.find_one({"email": auth_data["email"]})
-        
-        if not existing_user:
-            # Create new user
-            user_data = {
+        # One round trip creates the user on first login and leaves existing users untouched
+        await users_collection.update_one(
+            {"email": auth_data["email"]},
+            {"$setOnInsert": {
                 "id": auth_data["id"],
                 "email": auth_data["email"],
                 "name": auth_data["name"],
                 "picture": auth_data["picture"],
                 "created_at": datetime.utcnow()
-            }
-            await users_collection.insert_one(user_data)
+            }},
+            upsert=True
+        )
         
-        # Create session
-        session_data = {
-            "user_id": auth_data["id"],
-            "session_token": auth_data["session_token"],
-            "expires_at": datetime.utcnow() + timedelta(days=7)
-        }
-        await sessions_collection.insert_one(session_data)
+        # session_token is unique, so a repeated login refreshes the existing session;
+        # one refreshed within the coalescing window is left alone to save the write
+        now = datetime.utcnow()
+        expires_at = now + SESSION_LIFETIME
+        recently_refreshed = await sessions_collection.find_one(
+            {
+                "session_token": auth_data["session_token"],
+                "user_id": auth_data["id"],
+                "expires_at": {"$gte": expires_at - timedelta(seconds=SESSION_REFRESH_COALESCE_SECONDS)}
+            },
+            {"_id": 1}
+        )
+        if not recently_refreshed:
+            await sessions_collection.update_one(
+                {"session_token": auth_data["session_token"]},
+                {"$set": {
+                    "user_id": auth_data["id"],
+                    "session_token": auth_data["session_token"],
+                    "expires_at": expires_at
+                }},
+                upsert=True
+            )
+        
+        # Drop any cached view of this user or token so the next request reloads it
+        session_cache.invalidate_user(auth_data["id"])
+        session_cache.invalidate(auth_data["session_token"])
         
         return {"session_token": auth_data["session_token"], "user": auth_data}
         
     except httpx.RequestError:
         raise HTTPException(status_code=500, detail="Authentication service unavailable")
 
+@app.post("/api/auth/logout")
+async def logout(x_session_id: Optional[str] = Header(None)):
+    """End the current session"""
+    if not x_session_id:
+        raise HTTPException(status_code=401, detail="Session ID required")
+    
+    session_cache.invalidate(x_session_id)
+    await sessions_collection.delete_many({"session_token": x_session_id})
+    return {"message": "Logged out successfully"}
+
 @app.get("/api/auth/profile")
 async def get_profile(current_user: dict = Depends(get_current_user)):
     """Get current user profile"""
@@ -160,16 +1953,27 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
 
 # Category Routes
 @app.get("/api/categories", response_model=List[Category])
-async def get_categories(current_user: dict = Depends(get_current_user)):
+async def get_categories(
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     """Get all categories"""
-    categories = await categories_collection.find().to_list(100)
-    return categories
+    await category_catalog.refresh()
+    if etag_matches(if_none_match, category_catalog.etag):
+        return not_modified(category_catalog.etag)
+    
+    return Response(
+        content=category_catalog.body,
+        media_type="application/json",
+        headers={"ETag": category_catalog.etag, "Cache-Control": LIST_CACHE_CONTROL}
+    )
 
 # Prompt Routes
 @app.post("/api/prompts", response_model=Prompt)
 async def create_prompt(prompt: PromptCreate, current_user: dict = Depends(get_current_user)):
     """Create a new prompt"""
-    variables = extract_variables(prompt.content)
+    variables = await offloader.run(len(prompt.content), extract_variables, prompt.content)
+    now = utc_now()
     
     prompt_data = {
         "id": str(uuid.uuid4()),
@@ -178,104 +1982,1045 @@ async def create_prompt(prompt: PromptCreate, current_user: dict = Depends(get_c
         "category": prompt.category,
         "variables": variables,
         "user_id": current_user["id"],
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "created_at": now,
+        "updated_at": now,
+        "version": 1,
+        "change_seq": await next_change_seq(current_user["id"])
     }
     
     await prompts_collection.insert_one(prompt_data)
+    await prompt_versions_collection.insert_one(build_version_document(prompt_data, 1, None))
+    await apply_prompt_stats_delta(current_user["id"], *prompt_stats_delta(None, prompt_data))
+    search_indexes.on_upsert(prompt_data)
     return prompt_data
 
-@app.get("/api/prompts", response_model=List[Prompt])
+@app.get("/api/prompts", response_model=List[PromptListItem], response_model_exclude_unset=True)
 async def get_prompts(
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     search: Optional[str] = None,
+    search_mode: Literal["index", "regex"] = "regex",
+    limit: int = Query(100, ge=1, le=PROMPT_LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    serializer: Optional[Literal["fast", "validated"]] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get user's prompts with optional filtering"""
+    """Get user's prompts with optional filtering.
+
+    Results come in pages of ``limit``; when more remain, the ``X-Next-Cursor``
+    response header carries the cursor for the next page. ``fields`` limits the
+    returned attributes (e.g. ``title,category,variables``) for cheap list views.
+
+    ``search`` matches any substring of the title or content by default.
+    ``search_mode=index`` opts into the in-process search index instead, which
+    ranks results and matches whole words plus a prefix of the last word, so
+    ``ell`` does not find "Hello world" there.
+
+    Responses carry a weak ``ETag``; a matching ``If-None-Match`` gets a 304
+    after two small index-backed queries instead of a full list load.
+
+    ``serializer`` overrides ``SERIALIZATION_MODE`` for comparing the fast
+    byte-encoding path with response_model validation.
+    """
+    etag = await prompt_list_etag(current_user["id"], request)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = LIST_CACHE_CONTROL
+    
+    if search:
+        await enforce_rate_limit("search", current_user["id"])
+    
+    fast = use_fast_serializer(serializer)
     query = {"user_id": current_user["id"]}
+    projection = build_projection(fields) or (PROMPT_PROJECTION if fast else None)
+    position = decode_cursor(cursor) if cursor else {}
+    next_cursor = None
     
     if category:
         query["category"] = category
     
-    if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"content": {"$regex": search, "$options": "i"}}
-        ]
+    started = time.perf_counter()
+    # Users over the index budget get no index and are served by the regex scan
+    index = await search_indexes.get(current_user["id"]) if search and search_mode == "index" else None
     
-    prompts = await prompts_collection.find(query).sort("updated_at", -1).to_list(100)
+    if index is not None:
+        offset = position.get("o", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        
+        ranked_ids = index.search(search, category=category, limit=offset + limit + 1)
+        page_ids = ranked_ids[offset:offset + limit]
+        if len(ranked_ids) > offset + limit:
+            next_cursor = encode_cursor({"o": offset + limit})
+        
+        query["id"] = {"$in": page_ids}
+        prompts = await prompts_collection.find(query, projection).to_list(len(page_ids))
+        rank = {prompt_id: place for place, prompt_id in enumerate(page_ids)}
+        prompts.sort(key=lambda prompt: rank[prompt["id"]])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response.headers["Server-Timing"] = f'search;desc="index";dur={elapsed_ms:.2f}'
+    else:
+        conditions = []
+        if search:
+            pattern = re.escape(search)
+            conditions.append({"$or": [
+                {"title": {"$regex": pattern, "$options": "i"}},
+                {"content": {"$regex": pattern, "$options": "i"}}
+            ]})
+        if position:
+            try:
+                after_updated_at = datetime.fromisoformat(position["u"])
+                after_id = str(position["i"])
+            except (KeyError, TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            conditions.append({"$or": [
+                {"updated_at": {"$lt": after_updated_at}},
+                {"updated_at": after_updated_at, "id": {"$lt": after_id}}
+            ]})
+        if conditions:
+            query["$and"] = conditions
+        
+        prompts = await (
+            prompts_collection.find(query, projection)
+            .sort([("updated_at", -1), ("id", -1)])
+            .limit(limit + 1)
+            .to_list(limit + 1)
+        )
+        if len(prompts) > limit:
+            prompts = prompts[:limit]
+            last = prompts[-1]
+            next_cursor = encode_cursor({"u": last["updated_at"].isoformat(), "i": last["id"]})
+        if search:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            response.headers["Server-Timing"] = f'search;desc="regex";dur={elapsed_ms:.2f}'
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if fast:
+        return raw_json_response(prompts, response)
     return prompts
 
+# Bulk Import/Export
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))
+BULK_IMPORT_MAX_LINE_BYTES = int(os.getenv("BULK_IMPORT_MAX_LINE_BYTES", str(10 * 1024 * 1024)))
+BULK_IMPORT_MAX_REPORTED_ERRORS = 100
+
+async def iter_ndjson_lines(request: Request):
+    """Yield (line_number, raw_line) pairs from a streamed NDJSON request body"""
+    buffer = bytearray()
+    line_number = 0
+    async for chunk in request.stream():
+        # Only the new bytes can hold a newline; earlier ones were already searched
+        start, scan = 0, len(buffer)
+        buffer += chunk
+        end = buffer.find(b"\n", scan)
+        while end != -1:
+            line_number += 1
+            yield line_number, bytes(buffer[start:end])
+            start = end + 1
+            end = buffer.find(b"\n", start)
+        # Deleting a bytearray prefix is cheap, so the partial line isn't copied
+        del buffer[:start]
+        if len(buffer) > BULK_IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Line {line_number + 1} exceeds {BULK_IMPORT_MAX_LINE_BYTES} bytes"
+            )
+    if buffer:
+        yield line_number + 1, bytes(buffer)
+
+@app.post("/api/prompts/bulk")
+async def bulk_import_prompts(request: Request, current_user: dict = Depends(rate_limited("bulk", heavy=True))):
+    """Import prompts from an NDJSON body, one PromptCreate object per line.
+
+    Lines are written in unordered batches; invalid lines are skipped and
+    reported by line number without aborting the import.
+    """
+    inserted = 0
+    error_count = 0
+    errors = []
+    batch = []  # (line_number, document) pairs awaiting insert_many
+    
+    def record_error(line_number: int, message: str):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < BULK_IMPORT_MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "error": message})
+    
+    async def flush():
+        nonlocal inserted
+        if not batch:
+            return
+        first_seq = await next_change_seq(current_user["id"], len(batch)) - len(batch) + 1
+        # Stamped at reservation rather than parse time, which sync's safety window relies on
+        now = utc_now()
+        for offset, (_, document) in enumerate(batch):
+            document["change_seq"] = first_seq + offset
+            document["created_at"] = document["updated_at"] = now
+        failed_positions = set()
+        try:
+            result = await prompts_collection.insert_many([document for _, document in batch], ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as exc:
+            inserted += exc.details.get("nInserted", 0)
+            for write_error in exc.details.get("writeErrors", []):
+                failed_positions.add(write_error["index"])
+                record_error(batch[write_error["index"]][0], write_error.get("errmsg", "Write failed"))
+        stored = [document for position, (_, document) in enumerate(batch) if position not in failed_positions]
+        if stored:
+            await prompt_versions_collection.insert_many(
+                [build_version_document(document, 1, None) for document in stored],
+                ordered=False
+            )
+            await apply_prompt_stats_delta(
+                current_user["id"],
+                len(stored),
+                Counter(document["category"] for document in stored),
+                Counter(name for document in stored for name in document["variables"])
+            )
+        batch.clear()
+    
+    async for line_number, line in iter_ndjson_lines(request):
+        if not line.strip():
+            continue
+        try:
+            prompt = PromptCreate.model_validate_json(line)
+        except ValidationError as exc:
+            first = exc.errors()[0]
+            location = ".".join(str(part) for part in first.get("loc", ()))
+            record_error(line_number, f"{location}: {first['msg']}" if location else first["msg"])
+            continue
+        
+        now = utc_now()
+        batch.append((line_number, {
+            "id": str(uuid.uuid4()),
+            "title": prompt.title,
+            "content": prompt.content,
+            "category": prompt.category,
+            "variables": await offloader.run(len(prompt.content), extract_variables, prompt.content),
+            "user_id": current_user["id"],
+            "created_at": now,
+            "updated_at": now,
+            "version": 1
+        }))
+        if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+            await flush()
+    
+    await flush()
+    
+    if inserted:
+        await search_indexes.invalidate(current_user["id"])
+    return {"inserted": inserted, "failed": error_count, "errors": errors}
+
+@app.get("/api/prompts/export")
+async def export_prompts(current_user: dict = Depends(rate_limited("bulk", heavy=True))):
+    """Stream all of the user's prompts as NDJSON"""
+    cursor = prompts_collection.find(
+        {"user_id": current_user["id"]},
+        PROMPT_PROJECTION
+    ).sort([("updated_at", -1), ("id", -1)]).batch_size(BULK_IMPORT_BATCH_SIZE)
+    
+    async def ndjson_lines():
+        async for prompt in cursor:
+            yield dumps_json(prompt) + b"\n"
+    
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="prompts.ndjson"'}
+    )
+
+# Sync
+@app.get("/api/prompts/changes")
+async def get_prompt_changes(
+    since: Optional[str] = None,
+    limit: int = Query(PROMPT_LIST_MAX_LIMIT, ge=1, le=PROMPT_LIST_MAX_LIMIT),
+    current_user: dict = Depends(get_current_user)
+):
+    """Prompts created, updated or deleted since a sync token.
+
+    Without ``since`` only a starting token is returned: fetch it before loading
+    the full list, then pass it back to receive later changes in sequence order.
+    Follow ``has_more`` with the returned token until it is false. Changes made
+    within the last ``SYNC_SAFETY_WINDOW_SECONDS`` may be sent again by the next
+    token, so apply them idempotently. An expired token gets a 410, after which
+    the client should reload the list.
+    """
+    started = time.time()
+    user_id = current_user["id"]
+    if since is None:
+        seq = await committed_change_seq(user_id)
+        return {"changes": [], "deleted": [], "token": encode_sync_token(seq, started), "has_more": False}
+    
+    seq, page_seq, issued_at = decode_sync_token(since)
+    query = {"user_id": user_id, "change_seq": {"$gt": page_seq}}
+    prompts, tombstones = await asyncio.gather(
+        prompts_collection.find(query, {**PROMPT_PROJECTION, "change_seq": 1})
+        .sort("change_seq", ASCENDING)
+        .limit(limit + 1)
+        .to_list(limit + 1),
+        prompt_tombstones_collection.find(query, {"_id": 0, "prompt_id": 1, "change_seq": 1, "deleted_at": 1})
+        .sort("change_seq", ASCENDING)
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+    merged = sorted(prompts + tombstones, key=lambda entry: entry["change_seq"])
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+    last_seq = merged[-1]["change_seq"] if merged else page_seq
+    
+    cutoff = sync_safety_cutoff()
+    changes = []
+    deleted = []
+    for entry in merged:
+        if entry.get("updated_at", entry.get("deleted_at")) <= cutoff:
+            seq = entry["change_seq"]
+        if "prompt_id" in entry:
+            deleted.append(entry["prompt_id"])
+        else:
+            entry.pop("change_seq")
+            changes.append(entry)
+    
+    # A partial page keeps the original issue time: later tombstones are only
+    # guaranteed to exist from then on. Changes inside the safety window stay
+    # above the watermark and are sent again by the next token.
+    if has_more:
+        token = encode_sync_token(seq, issued_at, page_seq=last_seq)
+    else:
+        token = encode_sync_token(seq, started)
+    return raw_json_response({"changes": changes, "deleted": deleted, "token": token, "has_more": has_more})
+
+# Stats
+@app.get("/api/prompts/stats")
+async def get_prompt_stats(
+    top_variables: int = Query(10, ge=0, le=PROMPT_STATS_TOP_VARIABLES),
+    current_user: dict = Depends(get_current_user)
+):
+    """Prompt counts per category, the total, and the variables used by the most prompts"""
+    stats = await prompt_stats_collection.find_one({"user_id": current_user["id"]}, {"_id": 0})
+    if not stats or "rebuilt_at" not in stats:
+        # Users whose prompts predate the counters get a full count once
+        stats = await rebuild_prompt_stats(current_user["id"])
+    return summarize_prompt_stats(stats, top_variables)
+
+@app.post("/api/prompts/stats/rebuild")
+async def rebuild_stats(
+    top_variables: int = Query(10, ge=0, le=PROMPT_STATS_TOP_VARIABLES),
+    current_user: dict = Depends(rate_limited("bulk", heavy=True))
+):
+    """Recount the current user's stats from their prompts"""
+    stats = await rebuild_prompt_stats(current_user["id"])
+    return summarize_prompt_stats(stats, top_variables)
+
 @app.get("/api/prompts/{prompt_id}", response_model=Prompt)
-async def get_prompt(prompt_id: str, current_user: dict = Depends(get_current_user)):
+async def get_prompt(
+    prompt_id: str,
+    response: Response,
+    serializer: Optional[Literal["fast", "validated"]] = None,
+    current_user: dict = Depends(get_current_user)
+):
     """Get a specific prompt"""
-    prompt = await prompts_collection.find_one({"id": prompt_id, "user_id": current_user["id"]})
+    fast = use_fast_serializer(serializer)
+    prompt = await prompts_collection.find_one(
+        {"id": prompt_id, "user_id": current_user["id"]},
+        PROMPT_PROJECTION if fast else None
+    )
     if not prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
+    response.headers["ETag"] = prompt_etag(prompt)
+    if fast:
+        return raw_json_response(prompt, response)
     return prompt
 
 @app.put("/api/prompts/{prompt_id}", response_model=Prompt)
 async def update_prompt(
     prompt_id: str, 
     prompt_update: PromptUpdate, 
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    """Update a prompt"""
-    existing_prompt = await prompts_collection.find_one({"id": prompt_id, "user_id": current_user["id"]})
-    if not existing_prompt:
-        raise HTTPException(status_code=404, detail="Prompt not found")
+    """Update a prompt.
+
+    Send the prompt's ``ETag`` as ``If-Match`` to apply the update only if the
+    prompt hasn't changed since it was read; otherwise the response is 412.
+    """
+    query = {"id": prompt_id, "user_id": current_user["id"]}
+    if if_match is not None and if_match.strip() != "*":
+        # An unparseable tag can never match, which also ends in 412 below
+        query["updated_at"] = parse_prompt_etag(if_match)
     
-    update_data = {"updated_at": datetime.utcnow()}
+    update_data = {"updated_at": utc_now(), "change_seq": await next_change_seq(current_user["id"])}
     
     if prompt_update.title is not None:
         update_data["title"] = prompt_update.title
     if prompt_update.content is not None:
         update_data["content"] = prompt_update.content
-        update_data["variables"] = extract_variables(prompt_update.content)
+        update_data["variables"] = await offloader.run(
+            len(prompt_update.content), extract_variables, prompt_update.content
+        )
     if prompt_update.category is not None:
         update_data["category"] = prompt_update.category
     
-    await prompts_collection.update_one(
-        {"id": prompt_id, "user_id": current_user["id"]},
-        {"$set": update_data}
+    # The pre-update document is what the new revision is diffed against
+    previous = await prompts_collection.find_one_and_update(
+        query,
+        {"$set": update_data, "$inc": {"version": 1}},
+        return_document=ReturnDocument.BEFORE
     )
     
-    updated_prompt = await prompts_collection.find_one({"id": prompt_id, "user_id": current_user["id"]})
+    if not previous:
+        # Only the failure path pays for a second read, to tell 404 from 412
+        if "updated_at" in query and await prompts_collection.find_one(
+            {"id": prompt_id, "user_id": current_user["id"]}, {"_id": 1}
+        ):
+            raise HTTPException(status_code=412, detail="Prompt was modified by another request")
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    
+    previous_version = previous.get("version", 0)
+    updated_prompt = {**previous, **update_data, "version": previous_version + 1}
+    versions = []
+    if "version" not in previous:
+        # Prompts from before version history keep their last content as version 0
+        versions.append(build_version_document(previous, 0, None))
+    versions.append(await offloader.run(
+        len(previous["content"]) + len(updated_prompt["content"]),
+        build_version_document, updated_prompt, updated_prompt["version"], previous["content"]
+    ))
+    await prompt_versions_collection.insert_many(versions)
+    await apply_prompt_stats_delta(current_user["id"], *prompt_stats_delta(previous, updated_prompt))
+    
+    template_cache.invalidate(prompt_id)
+    search_indexes.on_upsert(updated_prompt)
+    response.headers["ETag"] = prompt_etag(updated_prompt)
     return updated_prompt
 
 @app.delete("/api/prompts/{prompt_id}")
 async def delete_prompt(prompt_id: str, current_user: dict = Depends(get_current_user)):
     """Delete a prompt"""
-    result = await prompts_collection.delete_one({"id": prompt_id, "user_id": current_user["id"]})
-    if result.deleted_count == 0:
+    deleted = await prompts_collection.find_one_and_delete(
+        {"id": prompt_id, "user_id": current_user["id"]},
+        projection={"_id": 0, "category": 1, "variables": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Prompt not found")
+    await apply_prompt_stats_delta(current_user["id"], *prompt_stats_delta(deleted, None))
+    await prompt_tombstones_collection.insert_one({
+        "user_id": current_user["id"],
+        "prompt_id": prompt_id,
+        "change_seq": await next_change_seq(current_user["id"]),
+        "deleted_at": datetime.utcnow()
+    })
+    await prompt_versions_collection.delete_many({"prompt_id": prompt_id, "user_id": current_user["id"]})
+    search_indexes.on_delete(current_user["id"], prompt_id)
+    template_cache.invalidate(prompt_id)
     return {"message": "Prompt deleted successfully"}
 
+@app.get("/api/prompts/{prompt_id}/versions", response_model=List[PromptVersionSummary])
+async def list_prompt_versions(
+    prompt_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=PROMPT_LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """List a prompt's versions newest first, paginated like the prompt list"""
+    query = {"prompt_id": prompt_id, "user_id": current_user["id"]}
+    if cursor:
+        before = decode_cursor(cursor).get("v")
+        if not isinstance(before, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["version"] = {"$lt": before}
+    
+    versions = await (
+        prompt_versions_collection.find(query, {"_id": 0, "version": 1, "title": 1, "category": 1, "created_at": 1})
+        .sort("version", DESCENDING)
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+    if not versions and not cursor:
+        if not await prompts_collection.find_one({"id": prompt_id, "user_id": current_user["id"]}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Prompt not found")
+    if len(versions) > limit:
+        versions = versions[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor({"v": versions[-1]["version"]})
+    return versions
+
+@app.get("/api/prompts/{prompt_id}/versions/{version}", response_model=PromptVersion)
+async def get_prompt_version(prompt_id: str, version: int, current_user: dict = Depends(get_current_user)):
+    """Get a prompt as it was at a given version"""
+    return await load_prompt_version(prompt_id, current_user["id"], version)
+
 # Template Routes
+BATCH_GENERATE_MAX_ITEMS = int(os.getenv("BATCH_GENERATE_MAX_ITEMS", "10000"))
+
+GENERATE_STREAM_CHUNK_CHARS = int(os.getenv("GENERATE_STREAM_CHUNK_CHARS", "65536"))
+BATCH_STREAM_CHUNK_ITEMS = 100
+GENERATE_MAX_INPUT_CHARS = int(os.getenv("GENERATE_MAX_INPUT_CHARS", str(10_000_000)))
+GENERATE_MAX_OUTPUT_CHARS = int(os.getenv("GENERATE_MAX_OUTPUT_CHARS", str(50_000_000)))
+
+def check_input_size(variable_sets: List[Dict[str, str]]):
+    """Reject requests whose variable values add up to more than GENERATE_MAX_INPUT_CHARS"""
+    if sum(len(value) for values in variable_sets for value in values.values()) > GENERATE_MAX_INPUT_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Variable values exceed {GENERATE_MAX_INPUT_CHARS} characters"
+        )
+
+def generation_size(templates: List[CompiledTemplate], variable_sets: List[Dict[str, str]]) -> int:
+    """Total output characters, rejecting responses over GENERATE_MAX_OUTPUT_CHARS"""
+    size = sum(template.output_size(values) for template in templates for values in variable_sets)
+    if size > GENERATE_MAX_OUTPUT_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Generated output would exceed {GENERATE_MAX_OUTPUT_CHARS} characters; use streaming"
+        )
+    return size
+
+def check_generation(template: CompiledTemplate, variables: Dict[str, str], strict: bool) -> tuple:
+    """Return (missing, unused) variable names, raising 422 in strict mode when there are any"""
+    missing, unused = template.check(variables)
+    
+    if strict and (missing or unused):
+        problems = []
+        if missing:
+            problems.append(f"Missing variables: {', '.join(missing)}")
+        if unused:
+            problems.append(f"Unknown variables: {', '.join(unused)}")
+        raise HTTPException(status_code=422, detail="; ".join(problems))
+    
+    return missing, unused
+
+def render_generation(template: CompiledTemplate, variables: Dict[str, str], strict: bool) -> Dict[str, Any]:
+    """Render one variable set, raising 422 in strict mode when variables don't match"""
+    missing, unused = check_generation(template, variables, strict)
+    return {
+        "generated_content": template.render(variables),
+        "missing_variables": missing,
+        "unused_variables": unused
+    }
+
+def batch_prompt_ids(batch: BatchGenerateRequest, max_items: int) -> List[str]:
+    """Distinct prompt ids of a batch, rejecting batches with more than ``max_items`` outputs"""
+    prompt_ids = list(dict.fromkeys(([batch.prompt_id] if batch.prompt_id else []) + batch.prompt_ids))
+    if not prompt_ids:
+        raise HTTPException(status_code=422, detail="prompt_id or prompt_ids is required")
+    if len(prompt_ids) * len(batch.variable_sets) > max_items:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {max_items} generated outputs")
+    return prompt_ids
+
+def render_batch_item(prompt_id: str, index: int, template: CompiledTemplate, variables: Dict[str, str], strict: bool) -> dict:
+    """Render one batch result; a strict-mode mismatch is reported on the item"""
+    item = {"prompt_id": prompt_id, "index": index}
+    try:
+        item.update(render_generation(template, variables, strict))
+    except HTTPException as exc:
+        item["error"] = exc.detail
+    return item
+
+def render_batch_items(entries: List[tuple], strict: bool) -> List[dict]:
+    """Render (prompt_id, index, template, variables) entries in order"""
+    return [render_batch_item(*entry, strict) for entry in entries]
+
+def dumps_generation(result: Dict[str, Any]) -> bytes:
+    """dumps_json for a result carrying ``generated_content``, encoding the text in pieces"""
+    text = result.get("generated_content")
+    if text is None or len(text) <= OFFLOAD_PIECE_CHARS:
+        return dumps_json(result)
+    head = dumps_json({key: value for key, value in result.items() if key != "generated_content"})
+    separator = b"," if len(head) > 2 else b""
+    return head[:-1] + separator + b'"generated_content":' + dumps_json_text(text) + b"}"
+
+def render_batch_ndjson(entries: List[tuple], strict: bool) -> bytes:
+    """Render entries as NDJSON lines, one result per line"""
+    return b"".join(dumps_generation(item) + b"\n" for item in render_batch_items(entries, strict))
+
+def batch_chunks(batch: BatchGenerateRequest, prompt_ids: List[str], templates: List[CompiledTemplate],
+                 max_items: int, max_chars: int):
+    """Yield (entries, output_chars) groups of a batch in result order, sized by predicted output.
+
+    Groups hold at most ``max_items`` entries and ``max_chars`` characters of
+    output; an entry larger than ``max_chars`` on its own gets a group of one.
+    """
+    entries = []
+    chars = 0
+    for prompt_id, template in zip(prompt_ids, templates):
+        for index, variables in enumerate(batch.variable_sets):
+            size = template.output_size(variables)
+            if entries and (len(entries) >= max_items or chars + size > max_chars):
+                yield entries, chars
+                entries = []
+                chars = 0
+            entries.append((prompt_id, index, template, variables))
+            chars += size
+    if entries:
+        yield entries, chars
+
+def batch_results(batch: BatchGenerateRequest, prompt_ids: List[str], templates: List[CompiledTemplate]):
+    """Yield one result per prompt and variable set; strict-mode mismatches are reported per item"""
+    for prompt_id, template in zip(prompt_ids, templates):
+        for index, variables in enumerate(batch.variable_sets):
+            yield render_batch_item(prompt_id, index, template, variables, batch.strict)
+
+def encode_batch(batch: BatchGenerateRequest, prompt_ids: List[str], templates: List[CompiledTemplate]) -> bytes:
+    """Render a whole batch straight to its JSON response body"""
+    items = [dumps_generation(item) for item in batch_results(batch, prompt_ids, templates)]
+    return b'{"results":[' + b",".join(items) + b'],"count":%d}' % len(items)
+
+def encode_generation(template: CompiledTemplate, variables: Dict[str, str], missing: List[str], unused: List[str]) -> bytes:
+    """Render one variable set straight to the generate response body"""
+    return dumps_generation({
+        "generated_content": template.render(variables),
+        "variables_used": variables,
+        "missing_variables": missing,
+        "unused_variables": unused
+    })
+
+@app.post("/api/prompts/generate/batch")
+async def generate_batch(
+    batch: BatchGenerateRequest,
+    stream: bool = False,
+    current_user: dict = Depends(rate_limited("batch", heavy=True))
+):
+    """Render every variable set against one or more prompt templates.
+
+    Results are ordered prompt by prompt, then by position in ``variable_sets``.
+    With ``stream=true`` they are sent as NDJSON, one result per line, rendered
+    in chunks of up to ``GENERATE_STREAM_CHUNK_CHARS`` characters through the
+    offloader. A strict-mode mismatch is reported on that item instead of
+    failing the whole batch.
+    """
+    prompt_ids = batch_prompt_ids(batch, BATCH_GENERATE_MAX_ITEMS)
+    check_input_size(batch.variable_sets)
+    templates = await asyncio.gather(
+        *(load_template(prompt_id, current_user["id"]) for prompt_id in prompt_ids)
+    )
+    
+    if not stream:
+        size = generation_size(templates, batch.variable_sets)
+        # Encoding up to GENERATE_MAX_OUTPUT_CHARS of JSON is as heavy as rendering it
+        body = await offloader.run(size, encode_batch, batch, prompt_ids, templates)
+        return Response(content=body, media_type="application/json")
+    
+    async def ndjson_lines():
+        chunks = batch_chunks(batch, prompt_ids, templates, BATCH_STREAM_CHUNK_ITEMS, GENERATE_STREAM_CHUNK_CHARS)
+        for entries, chars in chunks:
+            yield await offloader.run(chars, render_batch_ndjson, entries, batch.strict)
+            # Let other requests run between chunks of a large batch
+            await asyncio.sleep(0)
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 @app.post("/api/prompts/{prompt_id}/generate")
 async def generate_from_template(
     prompt_id: str,
     variables: Dict[str, str],
-    current_user: dict = Depends(get_current_user)
+    strict: bool = False,
+    current_user: dict = Depends(rate_limited("generate"))
 ):
-    """Generate text from prompt template with variables"""
-    prompt = await prompts_collection.find_one({"id": prompt_id, "user_id": current_user["id"]})
-    if not prompt:
-        raise HTTPException(status_code=404, detail="Prompt not found")
+    """Generate text from prompt template with variables.
+
+    With ``strict=true`` the request is rejected when template variables are
+    missing or unknown variables are supplied.
+    """
+    check_input_size([variables])
+    template = await load_template(prompt_id, current_user["id"])
+    size = generation_size([template], [variables])
+    missing, unused = check_generation(template, variables, strict)
+    body = await offloader.run(size, encode_generation, template, variables, missing, unused)
+    return Response(content=body, media_type="application/json")
+
+@app.post("/api/prompts/{prompt_id}/generate/stream")
+async def generate_stream(
+    prompt_id: str,
+    variables: Dict[str, str],
+    strict: bool = False,
+    current_user: dict = Depends(rate_limited("generate"))
+):
+    """Stream the generated text as plain text for very large templates or values.
+
+    The output is sent in chunks of ``GENERATE_STREAM_CHUNK_CHARS`` characters
+    as it is rendered. Missing and unused variable names are reported in the
+    ``X-Missing-Variables`` and ``X-Unused-Variables`` headers, since the body
+    is the generated text itself.
+    """
+    check_input_size([variables])
+    template = await load_template(prompt_id, current_user["id"])
+    missing, unused = check_generation(template, variables, strict)
+    
+    headers = {}
+    if missing:
+        headers["X-Missing-Variables"] = ",".join(missing)
+    if unused:
+        headers["X-Unused-Variables"] = ",".join(unused)
+    
+    async def chunks():
+        for chunk in template.iter_render(variables, GENERATE_STREAM_CHUNK_CHARS):
+            yield chunk.encode("utf-8")
+    
+    return StreamingResponse(chunks(), media_type="text/plain", headers=headers)
+
+# Jobs
+# Heavy work runs on a small pool of asyncio workers in every process. Jobs are
+# persisted in Mongo, so any worker process can pick them up and a job left
+# behind by a crashed process is claimed again once its heartbeat goes stale.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "5"))
+JOB_GENERATE_MAX_ITEMS = int(os.getenv("JOB_GENERATE_MAX_ITEMS", "200000"))
+JOB_RESULT_CHUNK_ITEMS = 500
+# At most 4 bytes per character in UTF-8, so a chunk stays under Mongo's 16MB document limit
+JOB_RESULT_CHUNK_CHARS = 3 * 1024 * 1024
+JOB_PROGRESS_INTERVAL_SECONDS = 1.0
+
+jobs_finished = LabeledCounter(
+    "contextos_jobs_finished_total",
+    "Background jobs finished by type and outcome",
+    ("type", "status")
+)
+job_wakeup: Optional[asyncio.Event] = None
+
+class JobProgress:
+    """Throttled progress reports for a running job, doubling as its heartbeat"""
+
+    def __init__(self, claim: Dict[str, str]):
+        self.claim = claim
+        self._last_report = 0.0
+
+    async def report(self, done: int, total: int, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_report < JOB_PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_report = now
+        await jobs_collection.update_one(
+            self.claim,
+            {"$set": {"progress": {"done": done, "total": total}, "heartbeat_at": datetime.utcnow()}}
+        )
+
+async def run_generate_batch_job(job: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    """Render a batch into job_results chunks, readable afterwards as NDJSON.
+
+    Each chunk is rendered through the offloader. Outputs too large to store
+    in a chunk are reported as item errors. Chunks are stamped with the job's
+    claim, so a worker that lost the job can't mix its chunks into the result.
+    """
+    batch = BatchGenerateRequest.model_validate(job["params"])
+    prompt_ids = batch_prompt_ids(batch, JOB_GENERATE_MAX_ITEMS)
+    templates = await asyncio.gather(*(load_template(prompt_id, job["user_id"]) for prompt_id in prompt_ids))
+    # The prompts may have grown since the job was submitted
+    generation_size(templates, batch.variable_sets)
+    # Results from an interrupted earlier attempt are rewritten from the start
+    await job_results_collection.delete_many({"job_id": job["id"], "claim": {"$ne": job["claim"]}})
+    
+    total = len(prompt_ids) * len(batch.variable_sets)
+    done = 0
+    errors = 0
+    chunks = batch_chunks(batch, prompt_ids, templates, JOB_RESULT_CHUNK_ITEMS, JOB_RESULT_CHUNK_CHARS)
+    for seq, (entries, chars) in enumerate(chunks):
+        if chars > JOB_RESULT_CHUNK_CHARS:
+            prompt_id, index, _, _ = entries[0]
+            items = [{
+                "prompt_id": prompt_id,
+                "index": index,
+                "error": f"Generated output exceeds {JOB_RESULT_CHUNK_CHARS} characters; use generate/stream"
+            }]
+        else:
+            items = await offloader.run(chars, render_batch_items, entries, batch.strict)
+        await job_results_collection.insert_one(
+            {"job_id": job["id"], "claim": job["claim"], "seq": seq, "items": items, "created_at": datetime.utcnow()}
+        )
+        done += len(items)
+        errors += sum("error" in item for item in items)
+        await progress.report(done, total)
+    
+    await progress.report(done, total, force=True)
+    # Drop anything an earlier claimant wrote after the delete above
+    await job_results_collection.delete_many({"job_id": job["id"], "claim": {"$ne": job["claim"]}})
+    return {"count": done, "errors": errors}
+
+async def run_reindex_search_job(job: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    """Invalidate the user's search index everywhere and rebuild it in this process"""
+    await search_indexes.invalidate(job["user_id"])
+    index = await search_indexes.get(job["user_id"])
+    if index is None:
+        return {"documents": 0, "indexed": False}
+    await progress.report(len(index.docs), len(index.docs), force=True)
+    return {"documents": len(index.docs), "indexed": True}
+
+async def run_recompute_variables_job(job: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    """Re-extract every prompt's variables and store the ones that changed"""
+    user_id = job["user_id"]
+    total = await prompts_collection.count_documents({"user_id": user_id})
+    scanned = 0
+    changed = []  # (prompt_id, variables) pairs awaiting a bulk write
+    updated = 0
+    
+    async def flush():
+        nonlocal updated
+        if not changed:
+            return
+        first_seq = await next_change_seq(user_id, len(changed)) - len(changed) + 1
+        # A new updated_at keeps list ETags and the sync safety window honest
+        now = utc_now()
+        await prompts_collection.bulk_write([
+            UpdateOne(
+                {"id": prompt_id, "user_id": user_id},
+                {"$set": {"variables": variables, "change_seq": first_seq + offset, "updated_at": now}}
+            )
+            for offset, (prompt_id, variables) in enumerate(changed)
+        ], ordered=False)
+        updated += len(changed)
+        changed.clear()
+    
+    cursor = prompts_collection.find(
+        {"user_id": user_id},
+        {"_id": 0, "id": 1, "content": 1, "variables": 1}
+    ).batch_size(BULK_IMPORT_BATCH_SIZE)
+    async for prompt in cursor:
+        scanned += 1
+        variables = await offloader.run(len(prompt["content"]), extract_variables, prompt["content"])
+        if set(variables) != set(prompt.get("variables") or ()):
+            changed.append((prompt["id"], variables))
+        if len(changed) >= BULK_IMPORT_BATCH_SIZE:
+            await flush()
+        if scanned % 100 == 0:
+            await asyncio.sleep(0)
+        await progress.report(scanned, total)
+    
+    await flush()
+    if updated:
+        await rebuild_prompt_stats(user_id)
+    await progress.report(scanned, total, force=True)
+    return {"scanned": scanned, "updated": updated}
+
+JOB_HANDLERS = {
+    "generate_batch": run_generate_batch_job,
+    "reindex_search": run_reindex_search_job,
+    "recompute_variables": run_recompute_variables_job,
+}
+
+async def claim_job() -> Optional[Dict[str, Any]]:
+    """Atomically take the oldest queued job, or one whose worker stopped heartbeating"""
+    now = datetime.utcnow()
+    return await jobs_collection.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=JOB_STALE_SECONDS)}}
+        ]},
+        {
+            "$set": {"status": "running", "started_at": now, "heartbeat_at": now, "claim": uuid.uuid4().hex},
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_job(job: Dict[str, Any]):
+    # Every write is conditional on the claim so a worker that lost its job can't clobber it
+    claim = {"id": job["id"], "claim": job["claim"]}
+    outcome = {"status": "succeeded"}
+    try:
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            raise HTTPException(status_code=500, detail=f"Job abandoned after {JOB_MAX_ATTEMPTS} attempts")
+        outcome["result"] = await JOB_HANDLERS[job["type"]](job, JobProgress(claim))
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back for another worker to pick up
+        await jobs_collection.update_one(claim, {"$set": {"status": "queued"}, "$inc": {"attempts": -1}})
+        raise
+    except HTTPException as exc:
+        outcome = {"status": "failed", "error": str(exc.detail)}
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", job["id"], job["type"])
+        outcome = {"status": "failed", "error": f"{type(exc).__name__}: {exc}"}
+    
+    outcome["finished_at"] = datetime.utcnow()
+    await jobs_collection.update_one(claim, {"$set": outcome})
+    jobs_finished.inc((job["type"], outcome["status"]))
+
+async def run_job_worker():
+    """Claim and run jobs until cancelled, sleeping until woken or the poll interval passes"""
+    while True:
+        try:
+            job = await claim_job()
+        except Exception:
+            logger.exception("Could not claim a job")
+            job = None
+        if job is None:
+            job_wakeup.clear()
+            # asyncio.wait, unlike wait_for, never swallows a cancellation that
+            # arrives as the event fires, so shutdown can't hang here
+            wakeup = asyncio.ensure_future(job_wakeup.wait())
+            try:
+                await asyncio.wait({wakeup}, timeout=JOB_POLL_INTERVAL_SECONDS)
+            finally:
+                wakeup.cancel()
+            continue
+        await run_job(job)
+
+def start_job_workers():
+    global job_wakeup
+    job_wakeup = asyncio.Event()
+    for _ in range(JOB_WORKERS):
+        background_tasks.append(asyncio.create_task(run_job_worker()))
+
+@app.post("/api/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(submission: JobSubmit, current_user: dict = Depends(rate_limited("jobs"))):
+    """Queue a background job.
+
+    ``generate_batch`` takes the same ``params`` as ``/api/prompts/generate/batch``
+    with a higher output cap; ``reindex_search`` and ``recompute_variables``
+    take none. Poll ``/api/jobs/{id}`` for progress and read the output from
+    ``/api/jobs/{id}/result`` once it has succeeded.
+    """
+    params = {}
+    if submission.type == "generate_batch":
+        try:
+            batch = BatchGenerateRequest.model_validate(submission.params)
+        except ValidationError as exc:
+            first = exc.errors()[0]
+            location = ".".join(str(part) for part in first.get("loc", ()))
+            detail = f"params.{location}: {first['msg']}" if location else first["msg"]
+            raise HTTPException(status_code=422, detail=detail)
+        prompt_ids = batch_prompt_ids(batch, JOB_GENERATE_MAX_ITEMS)
+        check_input_size(batch.variable_sets)
+        templates = await asyncio.gather(
+            *(load_template(prompt_id, current_user["id"]) for prompt_id in prompt_ids)
+        )
+        generation_size(templates, batch.variable_sets)
+        params = batch.model_dump()
+    
+    active = await jobs_collection.count_documents(
+        {"user_id": current_user["id"], "status": {"$in": ["queued", "running"]}}
+    )
+    if active >= JOB_MAX_ACTIVE_PER_USER:
+        raise HTTPException(
+            status_code=429,
+            detail=f"At most {JOB_MAX_ACTIVE_PER_USER} jobs can be queued or running at once",
+            headers={"Retry-After": str(max(1, math.ceil(JOB_POLL_INTERVAL_SECONDS)))}
+        )
+    
+    job = {
+        "id": str(uuid.uuid4()),
+        "user_id": current_user["id"],
+        "type": submission.type,
+        "params": params,
+        "status": "queued",
+        "progress": {"done": 0, "total": 0},
+        "attempts": 0,
+        "created_at": utc_now()
+    }
+    await jobs_collection.insert_one(job)
+    if job_wakeup is not None:
+        job_wakeup.set()
+    return job
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Get a job's status and progress"""
+    job = await jobs_collection.find_one({"id": job_id, "user_id": current_user["id"]}, {"_id": 0, "params": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str, current_user: dict = Depends(get_current_user)):
+    """A finished job's output: NDJSON results for ``generate_batch``, a JSON summary otherwise"""
+    job = await jobs_collection.find_one(
+        {"id": job_id, "user_id": current_user["id"]},
+        {"_id": 0, "type": 1, "status": 1, "result": 1, "claim": 1}
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if job["type"] != "generate_batch":
+        return job["result"]
     
-    content = prompt["content"]
+    cursor = job_results_collection.find(
+        {"job_id": job_id, "claim": job["claim"]}, {"_id": 0, "items": 1}
+    ).sort("seq", ASCENDING)
     
-    # Replace variables
-    for var_name, var_value in variables.items():
-        content = content.replace(f"{{{{{var_name}}}}}", var_value)
+    async def ndjson_lines():
+        async for chunk in cursor:
+            yield b"".join(dumps_json(item) + b"\n" for item in chunk["items"])
     
-    return {"generated_content": content, "variables_used": variables}
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "session_cache": session_cache.stats(),
+        "template_cache": template_cache.stats(),
+        "search_index": search_indexes.stats()
+    }
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: request and Mongo command latency plus cache counters"""
+    lines = []
+    for metric in (
+        http_request_duration, mongo_command_duration, mongo_command_failures, mongo_slow_commands,
+        compression_input_bytes, compression_output_bytes, rate_limit_rejections, jobs_finished, offload_calls
+    ):
+        lines.extend(metric.render())
+    lines.append("# TYPE contextos_offload_in_flight gauge")
+    lines.append(f"contextos_offload_in_flight {offloader.in_flight}")
+    
+    caches = (
+        ("session_cache", session_cache.stats()),
+        ("template_cache", template_cache.stats()),
+        ("search_index", search_indexes.stats()),
+    )
+    for cache_name, stats in caches:
+        for key in ("hits", "misses", "evictions"):
+            if key in stats:
+                lines.append(f"# TYPE contextos_{cache_name}_{key}_total counter")
+                lines.append(f"contextos_{cache_name}_{key}_total {stats[key]}")
+        for key in ("entries", "bytes", "chars", "oversized_users", "hit_ratio"):
+            if key in stats:
+                lines.append(f"# TYPE contextos_{cache_name}_{key} gauge")
+                lines.append(f"contextos_{cache_name}_{key} {stats[key]}")
+    
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    
+    parser = argparse.ArgumentParser(description="Run the ContextOS API")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        help="worker processes (default: WEB_CONCURRENCY or the CPU count)"
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        help="seconds to let in-flight requests finish on shutdown"
+    )
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+    
+    # Each worker imports the app itself, so pass it by name rather than as an object
+    uvicorn.run(
+        "server:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level
+    )
\ No newline at end of file
@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+ContextOS AI Prompt Manager - Backend Benchmarks
+Micro-benchmarks for backend hot paths and load tests for the API
+
+Usage:
+    python backend_benchmark.py render [--variables N] [--size BYTES] [--repeat N]
+    python backend_benchmark.py serialize [--prompts N] [--content-size BYTES] [--repeat N]
+    python backend_benchmark.py load [--base-url URL | --in-process] [--users N] [--prompts N]
+                                     [--duration SECONDS] [--rps N] [--concurrency N] [--mix OP=WEIGHT,...]
+    python backend_benchmark.py loop-lag [--executors none,thread,process] [--large-fraction F]
+                                         [--small-size CHARS] [--large-size CHARS] [--duration SECONDS]
+
+The load benchmark seeds users, sessions and prompts directly into MongoDB and
+serves the auth upstream from a local fake, so it needs no real logins. Against
+a running server, start that server with AUTH_SERVICE_URL pointing at the fake
+(http://127.0.0.1:<--auth-port>) and RATE_LIMIT_ENABLED=false. With --in-process the app runs inside the
+benchmark on an in-memory Mongo stand-in (requires mongomock-motor, see backend/requirements-dev.txt).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+from server import CompiledTemplate  # noqa: E402
+
+
+def print_header(title):
+    print("=" * 60)
+    print(title)
+    print("=" * 60)
+
+
+def timed(func, repeat):
+    """Return the best wall time in seconds over `repeat` runs of func()"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+class RenderBenchmark:
+    """Compare the compiled single-pass renderer against the legacy replace loop"""
+
+    def __init__(self, variable_count, size, repeat):
+        self.variable_count = variable_count
+        self.size = size
+        self.repeat = repeat
+
+    def build_template(self):
+        names = [f"var_{index}" for index in range(self.variable_count)]
+        filler_length = max(1, self.size // (self.variable_count * 2 or 1))
+        chunks = []
+        while sum(len(chunk) for chunk in chunks) < self.size:
+            chunks.append("".join(random.choices(string.ascii_letters + " ", k=filler_length)))
+            chunks.append("{{" + random.choice(names) + "}}")
+        values = {name: f"value-for-{name}" for name in names}
+        return "".join(chunks), values
+
+    @staticmethod
+    def legacy_render(content, variables):
+        for var_name, var_value in variables.items():
+            content = content.replace(f"{{{{{var_name}}}}}", var_value)
+        return content
+
+    def run(self):
+        print_header("TEMPLATE RENDERING BENCHMARK")
+        content, values = self.build_template()
+        print(f"Template size: {len(content):,} chars, {self.variable_count} variables")
+        print()
+
+        template = CompiledTemplate(content)
+        assert template.render(values) == self.legacy_render(content, values)
+
+        legacy = timed(lambda: self.legacy_render(content, values), self.repeat)
+        parse = timed(lambda: CompiledTemplate(content), self.repeat)
+        render = timed(lambda: template.render(values), self.repeat)
+
+        print(f"Legacy replace loop:      {legacy * 1000:10.3f} ms")
+        print(f"Compile (cache miss):     {parse * 1000:10.3f} ms")
+        print(f"Render (cache hit):       {render * 1000:10.3f} ms")
+        print(f"Compile + render:         {(parse + render) * 1000:10.3f} ms")
+        print()
+        print(f"Speedup on cache hit:     {legacy / render:10.1f}x")
+        print(f"Speedup on cache miss:    {legacy / (parse + render):10.1f}x")
+
+
+class SerializeBenchmark:
+    """Compare the fast JSON byte path against response_model validation for a prompt list"""
+
+    def __init__(self, prompt_count, content_size, repeat):
+        self.prompt_count = prompt_count
+        self.content_size = content_size
+        self.repeat = repeat
+
+    def build_documents(self):
+        now = datetime.utcnow()
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "title": f"Prompt {index}",
+                "content": "".join(random.choices(string.ascii_letters + " ", k=self.content_size)),
+                "category": "general",
+                "variables": ["name", "topic"],
+                "user_id": "bench-user",
+                "created_at": now,
+                "updated_at": now,
+            }
+            for index in range(self.prompt_count)
+        ]
+
+    @staticmethod
+    def validated(documents):
+        # What FastAPI does for response_model=List[PromptListItem], response_model_exclude_unset=True
+        from fastapi.encoders import jsonable_encoder
+        models = [server.PromptListItem.model_validate(document) for document in documents]
+        content = jsonable_encoder(models, exclude_unset=True)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def run(self):
+        print_header("RESPONSE SERIALIZATION BENCHMARK")
+        documents = self.build_documents()
+        fast_body = server.dumps_json(documents)
+        print(f"{self.prompt_count} prompts, {len(fast_body):,} bytes of JSON")
+        print(f"Encoder: {'orjson' if server.orjson is not None else 'stdlib json'}")
+        print()
+
+        assert json.loads(fast_body) == json.loads(self.validated(documents))
+        validated = timed(lambda: self.validated(documents), self.repeat)
+        fast = timed(lambda: server.dumps_json(documents), self.repeat)
+
+        print(f"Validated (response_model): {validated * 1000:10.3f} ms")
+        print(f"Fast (raw JSON bytes):      {fast * 1000:10.3f} ms")
+        print()
+        print(f"Speedup:                    {validated / fast:10.1f}x")
+
+
+class LoopLagBenchmark:
+    """Event-loop lag and request latency for mixed small/large renders, per offload executor"""
+
+    PROBE_INTERVAL = 0.005
+
+    def __init__(self, args):
+        self.args = args
+        self.small = RenderBenchmark(args.variables, args.small_size, 1).build_template()
+        self.large = RenderBenchmark(args.variables, args.large_size, 1).build_template()
+
+    async def run_executor(self, kind):
+        offloader = server.Offloader(
+            kind, self.args.threshold, server.OFFLOAD_MAX_WORKERS, server.OFFLOAD_MAX_PENDING,
+            server.OFFLOAD_QUEUE_TIMEOUT_SECONDS
+        )
+        offloader.start()
+        if kind == "process":
+            # Spin the workers up before measuring
+            await asyncio.gather(*(offloader.run(self.args.threshold, len, "") for _ in range(offloader.max_workers)))
+
+        lags = []
+        latencies = {"small": [], "large": []}
+        deadline = time.perf_counter() + self.args.duration
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await asyncio.sleep(self.PROBE_INTERVAL)
+                lags.append(time.perf_counter() - started - self.PROBE_INTERVAL)
+
+        async def client():
+            while time.perf_counter() < deadline:
+                kind_name = "large" if random.random() < self.args.large_fraction else "small"
+                content, values = self.large if kind_name == "large" else self.small
+                started = time.perf_counter()
+                # What generate_from_template does on a template cache miss
+                template = await offloader.run(len(content), CompiledTemplate, content)
+                await offloader.run(template.output_size(values), template.render, values)
+                latencies[kind_name].append(time.perf_counter() - started)
+                await asyncio.sleep(0)
+
+        try:
+            await asyncio.gather(probe(), *(client() for _ in range(self.args.concurrency)))
+        finally:
+            offloader.shutdown()
+        return sorted(lags), {name: sorted(values) for name, values in latencies.items()}
+
+    def run(self):
+        print_header("EVENT LOOP LAG BENCHMARK")
+        print(f"Small template: {len(self.small[0]):,} chars, large: {len(self.large[0]):,} chars, "
+              f"{self.args.large_fraction:.0%} large")
+        print(f"Offload threshold: {self.args.threshold:,} chars, {server.OFFLOAD_MAX_WORKERS} workers, "
+              f"{self.args.concurrency} concurrent clients, {self.args.duration:.0f}s per executor")
+        print()
+        print(f"{'executor':<9} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} "
+              f"{'small p50':>10} {'small p99':>10} {'large p50':>10} {'large p99':>10} {'renders':>8}")
+        print("-" * 89)
+        for kind in self.args.executors.split(","):
+            lags, latencies = asyncio.run(self.run_executor(kind.strip()))
+            small, large = latencies["small"], latencies["large"]
+            print(
+                f"{kind:<9} {percentile(lags, 0.50) * 1000:>8.2f} {percentile(lags, 0.99) * 1000:>8.2f} "
+                f"{(lags[-1] if lags else 0) * 1000:>8.2f} "
+                f"{percentile(small, 0.50) * 1000:>10.2f} {percentile(small, 0.99) * 1000:>10.2f} "
+                f"{percentile(large, 0.50) * 1000:>10.2f} {percentile(large, 0.99) * 1000:>10.2f} "
+                f"{len(small) + len(large):>8}"
+            )
+        print()
+        print("Lag is how late a 5 ms timer fires; all figures in ms.")
+
+
+BENCH_USER_PREFIX = "bench-user-"
+BENCH_WORDS = [
+    "email", "summary", "marketing", "python", "review", "proposal", "analysis", "tweet",
+    "outline", "refactor", "customer", "report", "launch", "release", "translate", "draft",
+]
+DEFAULT_MIX = "list=30,search=25,generate=25,update=10,create=8,login=2"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class FakeAuthService:
+    """Minimal keep-alive HTTP server standing in for the Emergent session-data endpoint.
+
+    Session id ``bench-<n>`` authenticates as benchmark user ``n``.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.server = None
+        self.requests = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                self.requests += 1
+                session_id = headers.get("x-session-id", "")
+                if session_id.startswith("bench-"):
+                    user_number = session_id[len("bench-"):]
+                    status, body = "200 OK", json.dumps({
+                        "id": f"{BENCH_USER_PREFIX}{user_number}",
+                        "email": f"{BENCH_USER_PREFIX}{user_number}@bench.local",
+                        "name": f"Bench User {user_number}",
+                        "picture": "",
+                        "session_token": f"bench-token-{user_number}",
+                    }).encode()
+                else:
+                    status, body = "404 Not Found", b"{}"
+
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class LoadBenchmark:
+    """Drive concurrent mixed traffic against the API and report latency percentiles"""
+
+    def __init__(self, args):
+        self.args = args
+        self.mix = self.parse_mix(args.mix)
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.users = []
+        self.db = None
+
+    @staticmethod
+    def parse_mix(spec):
+        mix = {}
+        for part in spec.split(","):
+            name, _, weight = part.partition("=")
+            if name.strip() not in LoadBenchmark.OPERATIONS:
+                raise SystemExit(f"Unknown operation in --mix: {name}")
+            mix[name.strip()] = float(weight or 1)
+        return mix
+
+    def make_content(self):
+        words = random.choices(BENCH_WORDS, k=max(1, self.args.prompt_size // 8))
+        for slot in range(0, len(words), max(1, len(words) // self.args.prompt_variables)):
+            words[slot] = "{{var_%d}}" % (slot % self.args.prompt_variables)
+        return " ".join(words)
+
+    async def seed(self):
+        now = datetime.utcnow()
+        users, sessions, prompts = [], [], []
+        for number in range(self.args.users):
+            user_id = f"{BENCH_USER_PREFIX}{number}"
+            token = f"bench-token-{number}"
+            users.append({
+                "id": user_id,
+                "email": f"{user_id}@bench.local",
+                "name": f"Bench User {number}",
+                "picture": "",
+                "created_at": now,
+            })
+            sessions.append({"user_id": user_id, "session_token": token, "expires_at": now + timedelta(days=1)})
+            prompt_ids = []
+            for index in range(self.args.prompts):
+                content = self.make_content()
+                prompt_id = str(uuid.uuid4())
+                prompt_ids.append(prompt_id)
+                stamp = now - timedelta(seconds=index)
+                prompts.append({
+                    "id": prompt_id,
+                    "title": f"{random.choice(BENCH_WORDS).title()} prompt {index}",
+                    "content": content,
+                    "category": random.choice(server.DEFAULT_CATEGORIES)["id"],
+                    "variables": server.extract_variables(content),
+                    "user_id": user_id,
+                    "created_at": stamp,
+                    "updated_at": stamp,
+                })
+            self.users.append({"number": number, "token": token, "prompt_ids": prompt_ids})
+
+        await self.cleanup()
+        await self.db.users.insert_many(users)
+        await self.db.sessions.insert_many(sessions)
+        for start in range(0, len(prompts), 1000):
+            await self.db.prompts.insert_many(prompts[start:start + 1000])
+
+    async def cleanup(self):
+        bench_filter = {"$regex": f"^{BENCH_USER_PREFIX}"}
+        await self.db.users.delete_many({"id": bench_filter})
+        await self.db.sessions.delete_many({"user_id": bench_filter})
+        await self.db.prompts.delete_many({"user_id": bench_filter})
+        # Bookkeeping the prompt write paths maintain alongside the prompts
+        for collection in ("prompt_versions", "prompt_tombstones", "sync_counters", "prompt_stats"):
+            await self.db[collection].delete_many({"user_id": bench_filter})
+
+    # Operations: each returns the HTTP response
+    async def op_list(self, client, user):
+        return await client.get("/api/prompts", params={"limit": 50}, headers=self.auth(user))
+
+    async def op_search(self, client, user):
+        query = random.choice(BENCH_WORDS)[:random.randint(3, 6)]
+        params = {"search": query, "search_mode": self.args.search_mode}
+        return await client.get("/api/prompts", params=params, headers=self.auth(user))
+
+    async def op_create(self, client, user):
+        response = await client.post("/api/prompts", headers=self.auth(user), json={
+            "title": f"Created {random.choice(BENCH_WORDS)}",
+            "content": self.make_content(),
+            "category": "general",
+        })
+        if response.status_code == 200:
+            user["prompt_ids"].append(response.json()["id"])
+        return response
+
+    async def op_update(self, client, user):
+        prompt_id = random.choice(user["prompt_ids"])
+        return await client.put(
+            f"/api/prompts/{prompt_id}",
+            headers=self.auth(user),
+            json={"title": f"Updated {random.choice(BENCH_WORDS)}"},
+        )
+
+    async def op_generate(self, client, user):
+        prompt_id = random.choice(user["prompt_ids"])
+        values = {f"var_{index}": random.choice(BENCH_WORDS) for index in range(self.args.prompt_variables)}
+        return await client.post(f"/api/prompts/{prompt_id}/generate", headers=self.auth(user), json=values)
+
+    async def op_login(self, client, user):
+        return await client.post("/api/auth/session", headers={"X-Session-ID": f"bench-{user['number']}"})
+
+    OPERATIONS = {
+        "list": op_list,
+        "search": op_search,
+        "create": op_create,
+        "update": op_update,
+        "generate": op_generate,
+        "login": op_login,
+    }
+
+    @staticmethod
+    def auth(user):
+        return {"X-Session-ID": user["token"]}
+
+    async def execute(self, client, slots):
+        name = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        user = random.choice(self.users)
+        async with slots:
+            started = time.perf_counter()
+            try:
+                response = await self.OPERATIONS[name](self, client, user)
+                ok = response.status_code < 400
+            except Exception:  # network errors count as failed requests
+                ok = False
+            elapsed = time.perf_counter() - started
+        self.latencies[name].append(elapsed)
+        if not ok:
+            self.errors[name] += 1
+
+    async def drive(self, client):
+        slots = asyncio.Semaphore(self.args.concurrency)
+        deadline = time.perf_counter() + self.args.duration
+
+        if self.args.rps > 0:
+            # Open loop: issue requests on a fixed schedule regardless of response times
+            interval = 1.0 / self.args.rps
+            tasks = []
+            next_start = time.perf_counter()
+            while next_start < deadline:
+                tasks.append(asyncio.create_task(self.execute(client, slots)))
+                next_start += interval
+                await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            await asyncio.gather(*tasks)
+        else:
+            # Closed loop: each of `concurrency` workers sends its next request when the last returns
+            async def worker():
+                while time.perf_counter() < deadline:
+                    await self.execute(client, slots)
+            await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+
+    async def warm_up(self, client):
+        # Touch every user's session once so steady-state numbers aren't dominated by cold caches
+        await asyncio.gather(*(self.op_list(client, user) for user in self.users))
+
+    async def run(self):
+        import httpx
+
+        auth_service = FakeAuthService(self.args.auth_port)
+        await auth_service.start()
+        server.AUTH_SERVICE_URL = f"http://127.0.0.1:{auth_service.port}"
+
+        if self.args.in_process:
+            try:
+                from mongomock_motor import AsyncMongoMockClient
+            except ImportError:
+                raise SystemExit("--in-process needs mongomock-motor: pip install mongomock-motor")
+            mongo = AsyncMongoMockClient()
+            self.db = mongo.contextos
+            server.client = mongo
+            server.db = self.db
+            for attribute in dir(server):
+                if attribute.endswith("_collection"):
+                    setattr(server, attribute, self.db[attribute[:-len("_collection")]])
+            # The benchmark deliberately exceeds per-user budgets
+            server.RATE_LIMIT_ENABLED = False
+            await server.startup_event()
+            transport = httpx.ASGITransport(app=server.app)
+            base_url = "http://in-process"
+        else:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo = AsyncIOMotorClient(self.args.mongo_url)
+            self.db = mongo.contextos
+            transport = None
+            base_url = self.args.base_url
+            print(f"Fake auth service listening on http://127.0.0.1:{auth_service.port}")
+
+        print_header("LOAD BENCHMARK")
+        print(f"Target: {'in-process app' if self.args.in_process else base_url}")
+        print(f"Seeding {self.args.users} users x {self.args.prompts} prompts...")
+        await self.seed()
+
+        limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+        try:
+            async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=30) as client:
+                await self.warm_up(client)
+                self.latencies.clear()
+                self.errors.clear()
+                started = time.perf_counter()
+                await self.drive(client)
+                elapsed = time.perf_counter() - started
+        finally:
+            if not self.args.keep_data:
+                await self.cleanup()
+            if self.args.in_process:
+                await server.shutdown_event()
+            await auth_service.stop()
+
+        self.report(elapsed)
+
+    def report(self, elapsed):
+        print()
+        print(f"{'operation':<10} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>8}")
+        print("-" * 75)
+        total = 0
+        for name in self.OPERATIONS:
+            samples = sorted(self.latencies.get(name, []))
+            if not samples:
+                continue
+            total += len(samples)
+            print(
+                f"{name:<10} {len(samples):>7} {self.errors[name]:>7} "
+                f"{percentile(samples, 0.50) * 1000:>9.2f} {percentile(samples, 0.95) * 1000:>9.2f} "
+                f"{percentile(samples, 0.99) * 1000:>9.2f} {samples[-1] * 1000:>9.2f} "
+                f"{len(samples) / elapsed:>8.1f}"
+            )
+        combined = sorted(value for samples in self.latencies.values() for value in samples)
+        print("-" * 75)
+        print(
+            f"{'all':<10} {total:>7} {sum(self.errors.values()):>7} "
+            f"{percentile(combined, 0.50) * 1000:>9.2f} {percentile(combined, 0.95) * 1000:>9.2f} "
+            f"{percentile(combined, 0.99) * 1000:>9.2f} {(combined[-1] if combined else 0) * 1000:>9.2f} "
+            f"{total / elapsed:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    render = subparsers.add_parser("render", help="template renderer vs. legacy replace loop")
+    render.add_argument("--variables", type=int, default=200)
+    render.add_argument("--size", type=int, default=1_000_000, help="template size in characters")
+    render.add_argument("--repeat", type=int, default=5)
+
+    serialize = subparsers.add_parser("serialize", help="fast JSON path vs. response_model validation")
+    serialize.add_argument("--prompts", type=int, default=1000)
+    serialize.add_argument("--content-size", type=int, default=2000, help="prompt content size in characters")
+    serialize.add_argument("--repeat", type=int, default=5)
+
+    load = subparsers.add_parser("load", help="concurrent mixed API traffic with latency percentiles")
+    target = load.add_mutually_exclusive_group()
+    target.add_argument("--base-url", default="http://localhost:8001")
+    target.add_argument("--in-process", action="store_true", help="run the app in-process on an in-memory Mongo")
+    load.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017/contextos"))
+    load.add_argument("--auth-port", type=int, default=8765, help="port for the fake auth service (0 = any)")
+    load.add_argument("--users", type=int, default=20)
+    load.add_argument("--prompts", type=int, default=200, help="prompts seeded per user")
+    load.add_argument("--prompt-size", type=int, default=2000, help="approximate prompt content size in characters")
+    load.add_argument("--prompt-variables", type=int, default=5)
+    load.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    load.add_argument("--rps", type=float, default=0, help="target requests per second (0 = closed loop)")
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. list=50,search=50")
+    load.add_argument("--search-mode", choices=("regex", "index"), default="regex")
+    load.add_argument("--keep-data", action="store_true", help="leave seeded documents in place")
+
+    loop_lag = subparsers.add_parser("loop-lag", help="event-loop lag under mixed small/large renders per executor")
+    loop_lag.add_argument("--executors", default="none,thread,process", help="comma-separated offload executors")
+    loop_lag.add_argument("--small-size", type=int, default=2_000, help="small template size in characters")
+    loop_lag.add_argument("--large-size", type=int, default=4_000_000, help="large template size in characters")
+    loop_lag.add_argument("--large-fraction", type=float, default=0.05, help="share of requests using the large template")
+    loop_lag.add_argument("--variables", type=int, default=20)
+    loop_lag.add_argument("--threshold", type=int, default=server.OFFLOAD_THRESHOLD_CHARS,
+                          help="offload inputs of at least this many characters")
+    loop_lag.add_argument("--concurrency", type=int, default=16)
+    loop_lag.add_argument("--duration", type=float, default=5.0, help="seconds per executor")
+
+    args = parser.parse_args()
+    if args.benchmark == "render":
+        RenderBenchmark(args.variables, args.size, args.repeat).run()
+    elif args.benchmark == "serialize":
+        SerializeBenchmark(args.prompts, args.content_size, args.repeat).run()
+    elif args.benchmark == "load":
+        asyncio.run(LoadBenchmark(args).run())
+    elif args.benchmark == "loop-lag":
+        LoopLagBenchmark(args).run()
+
+
+if __name__ == "__main__":
+    main()
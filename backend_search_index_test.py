@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+ContextOS AI Prompt Manager - Search Index Tests
+Ranking and prefix matching in PromptSearchIndex, and how SearchIndexRegistry builds and falls back
+
+Usage:
+    pip install -r backend/requirements-dev.txt
+    python -m pytest backend_search_index_test.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+from server import PromptSearchIndex, SearchIndexRegistry  # noqa: E402
+
+USER_ID = "search-user"
+
+
+def prompt(prompt_id, title, content="", category="general", age_minutes=0):
+    return {"id": prompt_id, "user_id": USER_ID, "title": title, "content": content, "category": category,
+            "updated_at": datetime(2024, 1, 1) - timedelta(minutes=age_minutes)}
+
+
+def assert_consistent(index):
+    assert index.terms == sorted(index.postings)
+    assert index.chars == sum(doc[3] for doc in index.docs.values())
+    for term, posting in index.postings.items():
+        assert posting
+        assert all(term in index.docs[prompt_id][2] for prompt_id in posting)
+
+
+def test_title_matches_rank_above_content_matches():
+    index = PromptSearchIndex.from_prompts([
+        prompt("body", "notes", "summary of the meeting"),
+        prompt("title", "summary", "notes"),
+    ])
+    assert index.search("summary") == ["title", "body"]
+
+
+def test_ties_rank_newest_first_and_category_filters():
+    index = PromptSearchIndex.from_prompts([
+        prompt("old", "draft email", age_minutes=10),
+        prompt("new", "draft email", age_minutes=1),
+        prompt("other", "draft email", category="coding"),
+    ])
+    assert index.search("draft", limit=2) == ["other", "new"]
+    assert index.search("draft", category="general") == ["new", "old"]
+
+
+def test_every_term_must_match():
+    index = PromptSearchIndex.from_prompts([
+        prompt("both", "translate email"),
+        prompt("one", "translate document"),
+    ])
+    assert index.search("translate email") == ["both"]
+    assert index.search("translate missing") == []
+    assert index.search("!!") == []
+
+
+def test_only_the_last_term_expands_as_a_prefix():
+    index = PromptSearchIndex.from_prompts([
+        prompt("exact", "sum"),
+        prompt("longer", "summary"),
+        prompt("unrelated", "sun"),
+    ])
+    # The exact term outranks a prefix-only match
+    assert index.search("sum") == ["exact", "longer"]
+    assert index.search("summ") == ["longer"]
+    assert index.search("sum report") == []
+    assert index._expand_prefix("su") == ["sum", "summary", "sun"]
+    assert index._expand_prefix("zz") == []
+
+
+def test_discard_keeps_terms_in_sync():
+    index = PromptSearchIndex.from_prompts([prompt("a", "alpha shared"), prompt("b", "beta shared")])
+    index.add(prompt("a", "gamma shared"))
+    assert "alpha" not in index.terms and "gamma" in index.terms
+    assert index.search("alp") == []
+    index.remove("b")
+    assert "beta" not in index.terms and "shared" in index.terms
+    index.remove("missing")
+    assert_consistent(index)
+
+    rng = random.Random(5)
+    words = [f"w{number}" for number in range(30)]
+    for _ in range(500):
+        prompt_id = f"p{rng.randrange(20)}"
+        if rng.random() < 0.3:
+            index.remove(prompt_id)
+        else:
+            index.add(prompt(prompt_id, " ".join(rng.sample(words, 3)), " ".join(rng.sample(words, 5))))
+    assert_consistent(index)
+    assert index.terms == sorted({term for doc in index.docs.values() for term in doc[2]})
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    database = AsyncMongoMockClient().contextos
+    monkeypatch.setattr(server, "prompts_collection", database.prompts)
+    monkeypatch.setattr(server, "sync_counters_collection", database.sync_counters)
+    return database.prompts
+
+
+class PausedOffloader:
+    """Holds a build at the tokenizing step until released"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def run(self, size, func, *args):
+        self.started.set()
+        await self.release.wait()
+        return func(*args)
+
+
+def test_writes_during_a_build_are_replayed(prompts, monkeypatch):
+    offloader = PausedOffloader()
+    monkeypatch.setattr(server, "offloader", offloader)
+    registry = SearchIndexRegistry(10, 300, 100, 10**6, 10**7)
+
+    async def run():
+        await prompts.insert_many([prompt("kept", "hello world"), prompt("renamed", "hello there"),
+                                   prompt("deleted", "hello again")])
+        build = asyncio.ensure_future(registry.get(USER_ID))
+        await offloader.started.wait()
+        registry.on_upsert(prompt("renamed", "zebra"))
+        registry.on_delete(USER_ID, "deleted")
+        registry.on_upsert(prompt("added", "hello newcomer"))
+        offloader.release.set()
+
+        index = await build
+        assert sorted(index.search("hello")) == ["added", "kept"]
+        assert index.search("zebra") == ["renamed"]
+        assert_consistent(index)
+        assert not registry._pending
+        assert await registry.get(USER_ID) is index
+
+    asyncio.run(run())
+
+
+def test_oversized_users_get_no_index_until_measured_again(prompts):
+    registry = SearchIndexRegistry(10, 300, 2, 10**6, 10**7)
+
+    async def run():
+        await prompts.insert_many([prompt(f"p{number}", f"title {number}") for number in range(3)])
+        assert await registry.get(USER_ID) is None
+        assert registry.stats()["oversized_users"] == 1
+
+        # Still marked, so raising the budget alone doesn't rebuild before the TTL
+        registry.max_docs = 100
+        assert await registry.get(USER_ID) is None
+
+        registry.max_chars = 10
+        await registry.invalidate(USER_ID)
+        assert await registry.get(USER_ID) is None
+
+        registry.max_chars = 10**6
+        await registry.invalidate(USER_ID)
+        index = await registry.get(USER_ID)
+        assert len(index.docs) == 3
+        assert registry.stats()["oversized_users"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+ContextOS AI Prompt Manager - Sync Tests
+Paging through /api/prompts/changes, deletes as tombstones and resends inside the safety window
+
+Usage:
+    pip install -r backend/requirements-dev.txt
+    python -m pytest backend_sync_test.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+from server import PromptCreate, create_prompt, delete_prompt, get_prompt_changes  # noqa: E402
+
+USER = {"id": "sync-user"}
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = AsyncMongoMockClient().contextos
+    for name in ("prompts", "prompt_versions", "prompt_tombstones", "sync_counters", "prompt_stats"):
+        monkeypatch.setattr(server, f"{name}_collection", database[name])
+    monkeypatch.setattr(server, "search_indexes", server.SearchIndexRegistry(10, 300, 1000, 10**6, 10**7))
+    return database
+
+
+async def changes(since=None, limit=server.PROMPT_LIST_MAX_LIMIT):
+    response = await get_prompt_changes(since=since, limit=limit, current_user=USER)
+    return response if isinstance(response, dict) else json.loads(response.body)
+
+
+async def create(title):
+    prompt = PromptCreate(title=title, content=f"{title} {{{{name}}}}", category="general")
+    return (await create_prompt(prompt, current_user=USER))["id"]
+
+
+async def settle(database):
+    """Move every write so far outside the safety window"""
+    earlier = timedelta(seconds=server.SYNC_SAFETY_WINDOW_SECONDS + 1)
+    async for prompt in database.prompts.find({}, {"id": 1, "updated_at": 1}):
+        await database.prompts.update_one({"id": prompt["id"]}, {"$set": {"updated_at": prompt["updated_at"] - earlier}})
+    async for tombstone in database.prompt_tombstones.find({}, {"deleted_at": 1}):
+        await database.prompt_tombstones.update_one(
+            {"_id": tombstone["_id"]}, {"$set": {"deleted_at": tombstone["deleted_at"] - earlier}}
+        )
+
+
+def test_has_more_pages_through_every_change(database):
+    async def run():
+        token = (await changes())["token"]
+        created = [await create(f"prompt {index}") for index in range(5)]
+        await settle(database)
+
+        seen = []
+        pages = 0
+        while True:
+            page = await changes(token, limit=2)
+            pages += 1
+            seen += [prompt["id"] for prompt in page["changes"]]
+            token = page["token"]
+            if not page["has_more"]:
+                break
+        assert pages == 3
+        assert seen == created
+
+        assert (await changes(token))["changes"] == []
+
+    asyncio.run(run())
+
+
+def test_deletes_arrive_as_tombstones(database):
+    async def run():
+        kept, removed = await create("kept"), await create("removed")
+        await settle(database)
+        token = (await changes())["token"]
+
+        await delete_prompt(removed, current_user=USER)
+        page = await changes(token)
+        assert page["deleted"] == [removed]
+        assert page["changes"] == []
+        assert kept not in page["deleted"]
+
+    asyncio.run(run())
+
+
+def test_changes_inside_safety_window_are_sent_again(database):
+    async def run():
+        token = (await changes())["token"]
+        recent = await create("recent")
+
+        first = await changes(token)
+        assert [prompt["id"] for prompt in first["changes"]] == [recent]
+        # Still inside the window, so the watermark hasn't moved past it
+        second = await changes(first["token"])
+        assert [prompt["id"] for prompt in second["changes"]] == [recent]
+
+        await settle(database)
+        third = await changes(second["token"])
+        assert [prompt["id"] for prompt in third["changes"]] == [recent]
+        assert (await changes(third["token"]))["changes"] == []
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("since", ["not-a-token", "e30", "eyJzIjoiMSJ9"])
+def test_malformed_token_is_rejected(database, since):
+    with pytest.raises(server.HTTPException) as rejected:
+        asyncio.run(changes(since))
+    assert rejected.value.status_code == 400
+    assert rejected.value.detail == "Invalid sync token"
@@ -156,6 +156,39 @@ class BackendTester:
                 False,
                 f"Request failed: {str(e)}"
             )
+        
+        # Test POST /api/auth/logout without token
+        try:
+            response = self.session.post(f"{API_BASE}/auth/logout")
+            if response.status_code == 401:
+                data = response.json()
+                if data.get("detail") == "Session ID required":
+                    self.log_test(
+                        "Auth Logout - No Token",
+                        True,
+                        "Correctly requires a session for logout endpoint",
+                        data
+                    )
+                else:
+                    self.log_test(
+                        "Auth Logout - No Token",
+                        False,
+                        "Wrong error message for missing auth",
+                        data
+                    )
+            else:
+                self.log_test(
+                    "Auth Logout - No Token",
+                    False,
+                    f"Expected 401, got {response.status_code}",
+                    response.text
+                )
+        except Exception as e:
+            self.log_test(
+                "Auth Logout - No Token",
+                False,
+                f"Request failed: {str(e)}"
+            )
     
     def test_categories_endpoint_security(self):
         """Test GET /api/categories requires authentication"""
@@ -198,7 +231,19 @@ class BackendTester:
             ("POST", "/prompts", "Create Prompt"),
             ("GET", "/prompts/test-id", "Get Single Prompt"),
             ("PUT", "/prompts/test-id", "Update Prompt"),
-            ("DELETE", "/prompts/test-id", "Delete Prompt")
+            ("DELETE", "/prompts/test-id", "Delete Prompt"),
+            ("POST", "/prompts/generate/batch", "Batch Generate"),
+            ("POST", "/prompts/bulk", "Bulk Import"),
+            ("GET", "/prompts/export", "Export Prompts"),
+            ("GET", "/prompts/test-id/versions", "List Prompt Versions"),
+            ("GET", "/prompts/test-id/versions/1", "Get Prompt Version"),
+            ("POST", "/prompts/test-id/generate/stream", "Stream Generate"),
+            ("GET", "/prompts/changes", "Prompt Changes"),
+            ("GET", "/prompts/stats", "Prompt Stats"),
+            ("POST", "/prompts/stats/rebuild", "Rebuild Prompt Stats"),
+            ("POST", "/jobs", "Submit Job"),
+            ("GET", "/jobs/test-id", "Get Job"),
+            ("GET", "/jobs/test-id/result", "Get Job Result")
         ]
         
         for method, endpoint, name in endpoints:
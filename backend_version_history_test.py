@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+ContextOS AI Prompt Manager - Version History Tests
+Round trips for the line-delta encoding and reconstruction across snapshot boundaries
+
+Usage:
+    pip install -r backend/requirements-dev.txt
+    python -m pytest backend_version_history_test.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+from server import apply_delta, build_version_document, diff_lines  # noqa: E402
+
+
+def random_edit(content, rng):
+    lines = content.splitlines(keepends=True)
+    for _ in range(rng.randint(1, 5)):
+        position = rng.randint(0, len(lines))
+        action = rng.choice(("insert", "delete", "replace"))
+        if action == "insert" or not lines:
+            lines.insert(position, f"line {rng.randint(0, 10**6)}\n")
+        elif action == "delete":
+            del lines[min(position, len(lines) - 1)]
+        else:
+            lines[min(position, len(lines) - 1)] = f"changed {rng.randint(0, 10**6)}\n"
+    return "".join(lines)
+
+
+@pytest.mark.parametrize("old, new", [
+    ("", ""),
+    ("", "a\nb\n"),
+    ("a\nb\n", ""),
+    ("a\nb\nc", "a\nb\nc"),
+    ("a\nb\nc", "a\nX\nc"),
+    ("no trailing newline", "no trailing newline\nmore"),
+    ("crlf\r\nlines\r\n", "crlf\r\nchanged\r\nlines\r\n"),
+    ("{{name}}\n}\n\n}\n", "}\n{{name}}\n\n}\n}\n"),
+])
+def test_diff_round_trip_edge_cases(old, new):
+    assert apply_delta(old, diff_lines(old, new)) == new
+
+
+def test_diff_round_trip_random_edits():
+    rng = random.Random(7)
+    content = "".join(f"line {index}\n" for index in range(200))
+    for _ in range(300):
+        edited = random_edit(content, rng)
+        assert apply_delta(content, diff_lines(content, edited)) == edited
+        content = edited
+
+
+def test_diff_of_repetitive_content_is_bounded():
+    rng = random.Random(11)
+    lines = [rng.choice(("}\n", "\n", "- item\n")) for _ in range(30000)]
+    old = "".join(lines)
+    for _ in range(20):
+        lines.insert(rng.randrange(len(lines)), "- inserted\n")
+    new = "".join(lines)
+
+    started = time.perf_counter()
+    delta = diff_lines(old, new)
+    assert time.perf_counter() - started < 2
+    if delta is not None:
+        assert apply_delta(old, delta) == new
+
+
+def test_oversized_change_falls_back_to_snapshot():
+    old = "".join(f"old {index}\n" for index in range(server.PROMPT_VERSION_DIFF_MAX_LINES))
+    new = "".join(f"new {index}\n" for index in range(server.PROMPT_VERSION_DIFF_MAX_LINES))
+    assert diff_lines(old, new) is None
+
+    prompt = {"id": "p", "user_id": "u", "title": "t", "category": "general", "content": new,
+              "updated_at": datetime.utcnow()}
+    document = build_version_document(prompt, 3, old)
+    assert document["content"] == new and "delta" not in document
+
+
+@pytest.fixture
+def version_collection(monkeypatch):
+    collection = AsyncMongoMockClient().contextos.prompt_versions
+    monkeypatch.setattr(server, "prompt_versions_collection", collection)
+    return collection
+
+
+def test_load_prompt_version_across_snapshot_boundaries(version_collection):
+    rng = random.Random(3)
+    interval = server.PROMPT_VERSION_SNAPSHOT_INTERVAL
+    contents = ["".join(f"line {index}\n" for index in range(300))]
+    for _ in range(interval * 3 + 5):
+        contents.append(random_edit(contents[-1], rng))
+
+    async def run():
+        documents = []
+        for version, content in enumerate(contents, start=1):
+            prompt = {"id": "p", "user_id": "u", "title": f"v{version}", "category": "general",
+                      "content": content, "updated_at": datetime.utcnow()}
+            documents.append(build_version_document(prompt, version, contents[version - 2] if version > 1 else None))
+        await version_collection.insert_many(documents)
+
+        snapshots = [document["version"] for document in documents if "content" in document]
+        assert snapshots[0] == 1 and interval in snapshots and interval * 2 in snapshots
+
+        for version, content in enumerate(contents, start=1):
+            rebuilt = await server.load_prompt_version("p", "u", version)
+            assert rebuilt["content"] == content
+            assert rebuilt["title"] == f"v{version}"
+
+        with pytest.raises(server.HTTPException) as missing:
+            await server.load_prompt_version("p", "other-user", 5)
+        assert missing.value.status_code == 404
+
+        # A lost delta breaks the chain until the next snapshot
+        await version_collection.delete_one({"prompt_id": "p", "version": interval + 3})
+        with pytest.raises(server.HTTPException) as broken:
+            await server.load_prompt_version("p", "u", interval + 5)
+        assert broken.value.detail == "Version history is incomplete"
+        assert (await server.load_prompt_version("p", "u", interval * 2))["content"] == contents[interval * 2 - 1]
+
+    asyncio.run(run())
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { BrowserRouter as Router } from 'react-router-dom';
 import Cookies from 'js-cookie';
 import iosNative from './utils/iosNative';
@@ -12,7 +12,7 @@ const AUTH_URL = process.env.REACT_APP_AUTH_URL || 'https://auth.emergentagent.c
 
 // API Service
 class ApiService {
-  static async request(endpoint, options = {}) {
+  static async send(endpoint, options = {}) {
     const sessionToken = Cookies.get('session_token');
     const headers = {
       'Content-Type': 'application/json',
@@ -31,6 +31,15 @@ class ApiService {
       return;
     }
 
+    return response;
+  }
+
+  static async request(endpoint, options = {}) {
+    const response = await this.send(endpoint, options);
+    if (!response) {
+      return;
+    }
+
     return response.json();
   }
 
@@ -38,6 +47,29 @@ class ApiService {
     return this.request(endpoint);
   }
 
+  // Follows X-Next-Cursor headers until every page of a list endpoint is loaded
+  static async getAll(endpoint, pageSize = 500) {
+    const items = [];
+    let cursor = null;
+
+    do {
+      const params = new URLSearchParams({ limit: pageSize });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+
+      const response = await this.send(`${endpoint}?${params}`);
+      if (!response) {
+        return;
+      }
+
+      items.push(...(await response.json()));
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+
+    return items;
+  }
+
   static async post(endpoint, data) {
     return this.request(endpoint, {
       method: 'POST',
@@ -158,13 +190,17 @@ const Dashboard = ({ user, onLogout }) => {
   const [editingPrompt, setEditingPrompt] = useState(null);
   const [generatingPrompt, setGeneratingPrompt] = useState(null);
   const [loading, setLoading] = useState(true);
+  const syncToken = useRef(null);
 
   const loadData = async () => {
     try {
+      // Take the sync token first so changes made during the full load are replayed later
+      const { token } = await ApiService.get('/api/prompts/changes');
       const [promptsData, categoriesData] = await Promise.all([
-        ApiService.get('/api/prompts'),
+        ApiService.getAll('/api/prompts'),
         ApiService.get('/api/categories')
       ]);
+      syncToken.current = token;
       setPrompts(promptsData);
       setCategories(categoriesData);
     } catch (error) {
@@ -176,6 +212,46 @@ const Dashboard = ({ user, onLogout }) => {
     }
   };
 
+  // Applies only what changed since the last load or sync; falls back to a full reload
+  const syncPrompts = async () => {
+    if (!syncToken.current) {
+      return loadData();
+    }
+
+    const updated = new Map();
+    const deleted = new Set();
+    let page;
+    do {
+      const params = new URLSearchParams({ since: syncToken.current });
+      const response = await ApiService.send(`/api/prompts/changes?${params}`);
+      if (!response) {
+        return;
+      }
+      if (!response.ok) {
+        syncToken.current = null;
+        return loadData();
+      }
+
+      page = await response.json();
+      page.changes.forEach(prompt => {
+        updated.set(prompt.id, prompt);
+        deleted.delete(prompt.id);
+      });
+      page.deleted.forEach(id => {
+        updated.delete(id);
+        deleted.add(id);
+      });
+      syncToken.current = page.token;
+    } while (page.has_more);
+
+    setPrompts(current => {
+      const merged = current
+        .filter(prompt => !deleted.has(prompt.id) && !updated.has(prompt.id))
+        .concat([...updated.values()]);
+      return merged.sort((a, b) => (b.updated_at > a.updated_at ? 1 : b.updated_at < a.updated_at ? -1 : 0));
+    });
+  };
+
   useEffect(() => {
     loadData();
     
@@ -207,7 +283,7 @@ const Dashboard = ({ user, onLogout }) => {
         iosNative.showIOSToast('Prompt created successfully!');
       }
       
-      await loadData();
+      await syncPrompts();
       setShowCreateModal(false);
       setEditingPrompt(null);
       iosNative.hapticFeedback('success');
@@ -229,7 +305,7 @@ const Dashboard = ({ user, onLogout }) => {
         const loadingIndicator = iosNative.showActivityIndicator('Deleting prompt...');
         
         await ApiService.delete(`/api/prompts/${promptId}`);
-        await loadData();
+        await syncPrompts();
         
         iosNative.hapticFeedback('success');
         iosNative.showIOSToast('Prompt deleted successfully!');
@@ -428,6 +504,7 @@ const App = () => {
     iosNative.hapticFeedback('medium');
     
     if (window.confirm('Are you sure you want to logout?')) {
+      ApiService.post('/api/auth/logout', {}).catch(() => {});
       Cookies.remove('session_token');
       setUser(null);
       iosNative.hapticFeedback('success');